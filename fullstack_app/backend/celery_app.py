@@ -4,9 +4,37 @@ Celery application setup.  This file configures the Celery instance and register
 Celery is used here for executing long‑running agent tasks in the background.  The
 broker and result backend default to Redis but can be configured via environment
 variables.  See `SETUP.md` for details on running the worker.
+
+Agent jobs are routed to one queue per agent and priority class, named
+`agents.{agent}.{class}` (e.g. `agents.tsd.batch`), so heavy batch work for one
+agent cannot starve interactive requests or other agents.  Workers can be
+dedicated to a subset of queues with `-Q`.  Within a queue, interactive jobs
+also carry a higher broker priority.
+
+Jobs are acknowledged when they finish, so a job still unacknowledged after
+the Redis visibility timeout is delivered again.  `CELERY_VISIBILITY_TIMEOUT`
+must therefore exceed the longest job; it is also how long a job lost with
+its worker waits before it runs again.
 """
 import os
+from typing import List
+
 from celery import Celery
+from kombu import Queue
+from celery.signals import worker_process_init, worker_process_shutdown, worker_ready, worker_shutdown
+from celery.utils.log import current_process_index
+
+from src.services.queues import EXTRACTION_QUEUE, PRIORITY_CLASSES, agent_queue
+
+
+def _agent_queues() -> List[Queue]:
+    from src.agents.registry import agent_registry
+
+    return [
+        Queue(agent_queue(agent["name"], priority_class))
+        for agent in agent_registry.list()
+        for priority_class in PRIORITY_CLASSES
+    ]
 
 
 def make_celery() -> Celery:
@@ -26,8 +54,68 @@ def make_celery() -> Celery:
         "accept_content": ["json"],
         "timezone": "UTC",
         "enable_utc": True,
+        # Workers without -Q consume every agent queue plus the default and
+        # extraction ones
+        "task_queues": [Queue("celery"), Queue(EXTRACTION_QUEUE)] + _agent_queues(),
+        "broker_transport_options": {
+            "queue_order_strategy": "priority",
+            "priority_steps": list(range(10)),
+            "sep": ":",
+            "visibility_timeout": int(os.environ.get("CELERY_VISIBILITY_TIMEOUT", str(12 * 3600))),
+        },
+        # Agent jobs run for minutes: acknowledge after completion and only
+        # reserve one job at a time so idle workers can take queued work
+        "task_acks_late": os.environ.get("CELERY_ACKS_LATE", "1") != "0",
+        "task_reject_on_worker_lost": True,
+        "worker_prefetch_multiplier": int(os.environ.get("CELERY_PREFETCH_MULTIPLIER", "1")),
     })
+    # Make shared tasks dispatch through this app from any thread
+    celery.set_default()
     return celery
 
 
-celery_app = make_celery()
\ No newline at end of file
+celery_app = make_celery()
+
+
+@worker_process_init.connect
+def preload_agents(**kwargs) -> None:
+    """Discover agents and parse their RAG assets once per worker process."""
+    from src.agents import agent_registry
+
+    agent_registry.preload()
+
+
+def _serve_metrics(offset: int) -> None:
+    port = int(os.environ.get("METRICS_PORT", "0"))
+    if port:
+        from src.services.metrics import start_metrics_server
+
+        start_metrics_server(port + offset)
+
+
+@worker_process_init.connect
+def serve_child_metrics(**kwargs) -> None:
+    """
+    Serve `/metrics` from each prefork child, on `METRICS_PORT` plus the
+    child's index.
+    """
+    _serve_metrics(current_process_index(base=0) or 0)
+
+
+@worker_ready.connect
+def serve_worker_metrics(sender=None, **kwargs) -> None:
+    """Serve `/metrics` on `METRICS_PORT` from workers that run tasks in-process (threads, solo)."""
+    from celery.concurrency.prefork import TaskPool
+
+    if not isinstance(getattr(sender, "pool", None), TaskPool):
+        _serve_metrics(0)
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def stop_worker_loop(**kwargs) -> None:
+    """Close pooled provider connections and stop the worker's event loop."""
+    from src.models.providers import close_providers
+    from src.services.event_loop import worker_loop
+
+    worker_loop.stop(close_providers())
@@ -8,6 +8,7 @@ requested.  Modes:
   * both – code followed by an explanation
 """
 import re
+from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 from ..base import BaseAgent
@@ -17,12 +18,15 @@ from ...utils.document_extractor import extract_text_from_files
 class Agent(BaseAgent):
     name = "abap"
     description = "Generate SAP ABAP code from natural language or examples"
+    rag_path = Path(__file__).resolve().parent / "rag"
 
     async def run(self, job_id: str, input_text: Optional[str], files: Optional[List[Dict[str, str]]]) -> Any:
         if not input_text and not files:
             raise ValueError("ABAP Agent requires input text or files")
         # Extract text from files (if provided) and append to input
         extracted = await extract_text_from_files(files) if files else ""
+        # Condense oversized documents; the user's instructions are kept verbatim
+        extracted = await self.fit_context(job_id, extracted) if extracted else ""
         combined = "\n".join(filter(None, [extracted, input_text]))
         # Detect mode based on keywords in user input
         lower = (input_text or "").lower()
@@ -3,18 +3,30 @@ Base classes and utilities for agents.  All agent classes should inherit from
 `BaseAgent` and override the `run` coroutine.  The base class provides helper
 methods for reading RAG files, calling language models, and updating job progress.
 """
-import json
+import asyncio
 import os
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Mapping, Optional, Sequence
 
 import aiofiles
 
+from .registry import load_rag_assets
+from ..services import metrics
 from ..services.job_manager import job_manager, JobStatus
 from ..models.providers import get_model
+from ..models.response_cache import generate
+from ..models.tokens import count_tokens
 from ..utils.document_extractor import extract_text_from_files
 from ..utils.docx_builder import DocxBuilder
+from ..rag import RAG_ENABLED, VectorIndex, get_agent_index
+from ..rag.chunking import chunk_text
+
+# Input context larger than this many tokens is condensed by map-reduce
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "8000"))
+CONTEXT_CHUNK_TOKENS = int(os.environ.get("CONTEXT_CHUNK_TOKENS", "2000"))
+SUMMARY_CONCURRENCY = int(os.environ.get("SUMMARY_CONCURRENCY", "4"))
+_MAX_REDUCE_ROUNDS = 3
 
 
 class BaseAgent(ABC):
@@ -25,24 +37,29 @@ class BaseAgent(ABC):
     name: str = "base"
     description: str = ""
     rag_path: Path = Path(__file__).resolve().parent / "rag"
+    # Whether identical prompts may be answered from the LLM response cache
+    cache_responses: bool = True
+    # Priority class used when a run request does not specify one
+    default_priority: str = "interactive"
 
-    def __init__(self) -> None:
-        # Preload RAG assets if they exist
-        self.sections_def: Optional[List[Dict[str, Any]]] = None
-        sections_file = self.rag_path / "sections.json"
-        if sections_file.exists():
-            with open(sections_file, "r", encoding="utf-8") as f:
-                self.sections_def = json.load(f)
-        self.guidelines: Optional[str] = None
-        guidelines_file = self.rag_path / "guidelines.md"
-        if guidelines_file.exists():
-            with open(guidelines_file, "r", encoding="utf-8") as f:
-                self.guidelines = f.read()
-        self.formatting: Optional[Dict[str, Any]] = None
-        fmt_file = self.rag_path / "formatting.json"
-        if fmt_file.exists():
-            with open(fmt_file, "r", encoding="utf-8") as f:
-                self.formatting = json.load(f)
+    def __init__(self, force: bool = False) -> None:
+        # Bypass memoized results of earlier runs
+        self.force = force
+        # RAG assets are parsed once per folder and shared between instances
+        assets = load_rag_assets(self.rag_path)
+        self.sections_def: Optional[Sequence[Mapping[str, Any]]] = assets.sections
+        self.guidelines: Optional[str] = assets.guidelines
+        self.formatting: Optional[Mapping[str, Any]] = assets.formatting
+
+    async def knowledge_index(self) -> Optional[VectorIndex]:
+        """
+        Return the retrieval index over this agent's RAG folder, or None when
+        retrieval is disabled or the folder holds no knowledge files.
+        """
+        if not RAG_ENABLED:
+            return None
+        index = await asyncio.to_thread(get_agent_index, self.name, self.rag_path)
+        return index if len(index) else None
 
     async def update_progress(self, job_id: str, message: str) -> None:
         """
@@ -50,16 +67,66 @@ class BaseAgent(ABC):
         """
         await job_manager.update_job(job_id, JobStatus.RUNNING, log=message)
 
-    async def call_llm(self, prompt: str, model_name: str = "gpt-3.5-turbo", stream: bool = False) -> str:
+    async def call_llm(
+        self,
+        prompt: str,
+        model_name: str = "gpt-3.5-turbo",
+        stream: bool = False,
+        use_cache: Optional[bool] = None,
+        schema: Optional[Dict[str, Any]] = None,
+    ) -> str:
         """
         Call the configured language model provider with the given prompt.  This
         helper hides the details of the underlying provider and returns a string
         result.  Streaming is not implemented here; streaming occurs at the
-        HTTP layer in the chat API.
+        HTTP layer in the chat API.  With `schema`, the reply is requested as
+        JSON matching it; providers without structured output support answer
+        in plain text.  Responses are served from the response cache unless
+        disabled for the agent (`cache_responses`) or the call (`use_cache`).
+        The call is timed as the `llm` pipeline stage.
         """
         model = get_model(model_name)
+        if use_cache is None:
+            use_cache = self.cache_responses
         # Each provider should expose an async `generate` function returning text
-        text = await model.generate(prompt)
+        with metrics.span("llm"):
+            return await generate(model, model_name, prompt, use_cache=use_cache, schema=schema)
+
+    async def fit_context(self, job_id: str, text: str, model_name: str = "gpt-3.5-turbo", budget: Optional[int] = None) -> str:
+        """
+        Return `text` unchanged if it fits in `budget` tokens, otherwise a
+        condensed version: the text is split into chunks that are summarized in
+        parallel (map) and joined (reduce), repeating while the result is still
+        too large.  The condensed context is meant to be computed once and
+        reused by every prompt of a run.
+        """
+        budget = budget or CONTEXT_TOKEN_BUDGET
+        tokens = await asyncio.to_thread(count_tokens, text, model_name)
+        for round_no in range(1, _MAX_REDUCE_ROUNDS + 1):
+            if tokens <= budget:
+                return text
+            chars_per_token = len(text) / tokens
+            chunks = chunk_text(text, chunk_size=max(1, int(CONTEXT_CHUNK_TOKENS * chars_per_token)), overlap=0)
+            await self.update_progress(job_id, f"Condensing large input: summarizing {len(chunks)} chunks (round {round_no})")
+            # Share the budget between chunk summaries (roughly 0.75 words per token)
+            words = max(50, int(budget / len(chunks) * 0.75))
+            semaphore = asyncio.Semaphore(max(1, SUMMARY_CONCURRENCY))
+
+            async def summarize(chunk: str) -> str:
+                prompt = (
+                    "Condense the following excerpt of a source document for use in a technical specification. "
+                    "Preserve names, identifiers, fields, values and requirements; drop repetition and filler. "
+                    f"Use at most {words} words.\n\nExcerpt:\n{chunk}\n"
+                )
+                async with semaphore:
+                    return (await self.call_llm(prompt, model_name=model_name)).strip()
+
+            summaries = await asyncio.gather(*(summarize(chunk) for chunk in chunks))
+            text = "\n\n".join(summaries)
+            tokens = await asyncio.to_thread(count_tokens, text, model_name)
+        if tokens > budget:
+            # Summaries did not converge; keep the leading part that fits
+            text = text[: int(budget * len(text) / tokens)]
         return text
 
     async def run(self, job_id: str, input_text: Optional[str], files: Optional[List[Dict[str, str]]]) -> Any:
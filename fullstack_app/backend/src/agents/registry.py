@@ -0,0 +1,126 @@
+"""
+Agent registry.  Agent packages under `src/agents` are discovered and imported
+once, after which listing and lookup are in-memory dictionary operations.  An
+agent can be looked up by its package name (`tsd_agent`) or its declared
+`name` (`tsd`).
+
+RAG assets (`sections.json`, `guidelines.md`, `formatting.json`) are parsed
+once per folder and shared, read-only, by every agent instance; they are only
+re-read when one of the files' mtime changes.
+"""
+import importlib
+import json
+import logging
+import os
+import pkgutil
+import threading
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+_RAG_FILES = ("sections.json", "guidelines.md", "formatting.json")
+
+
+class RagAssets(NamedTuple):
+    sections: Optional[Tuple[Mapping[str, Any], ...]]
+    guidelines: Optional[str]
+    formatting: Optional[Mapping[str, Any]]
+    mtimes: Tuple[Optional[int], ...]
+
+
+_assets: Dict[Path, RagAssets] = {}
+_assets_lock = threading.Lock()
+
+
+def _mtimes(rag_path: Path) -> Tuple[Optional[int], ...]:
+    stamps = []
+    for name in _RAG_FILES:
+        try:
+            stamps.append(os.stat(rag_path / name).st_mtime_ns)
+        except OSError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+def _read_assets(rag_path: Path, mtimes: Tuple[Optional[int], ...]) -> RagAssets:
+    sections = guidelines = formatting = None
+    if mtimes[0] is not None:
+        with open(rag_path / "sections.json", "r", encoding="utf-8") as f:
+            sections = tuple(MappingProxyType(section) for section in json.load(f))
+    if mtimes[1] is not None:
+        with open(rag_path / "guidelines.md", "r", encoding="utf-8") as f:
+            guidelines = f.read()
+    if mtimes[2] is not None:
+        with open(rag_path / "formatting.json", "r", encoding="utf-8") as f:
+            formatting = MappingProxyType(json.load(f))
+    return RagAssets(sections, guidelines, formatting, mtimes)
+
+
+def load_rag_assets(rag_path: Path) -> RagAssets:
+    """Return the shared, read-only RAG assets of a folder, re-reading them only if changed."""
+    mtimes = _mtimes(rag_path)
+    assets = _assets.get(rag_path)
+    if assets is not None and assets.mtimes == mtimes:
+        return assets
+    with _assets_lock:
+        assets = _assets.get(rag_path)
+        if assets is None or assets.mtimes != mtimes:
+            assets = _read_assets(rag_path, mtimes)
+            _assets[rag_path] = assets
+        return assets
+
+
+class AgentRegistry:
+    def __init__(self, package: str = "src.agents", directory: Optional[str] = None) -> None:
+        self.package = package
+        self.directory = directory or os.path.dirname(__file__)
+        self._agents: Dict[str, Type[Any]] = {}
+        self._listing: List[Dict[str, str]] = []
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _discover(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            agents: Dict[str, Type[Any]] = {}
+            listing: List[Dict[str, str]] = []
+            for _, name, ispkg in pkgutil.iter_modules([self.directory]):
+                if not ispkg or name.startswith("__"):
+                    continue
+                try:
+                    module = importlib.import_module(f"{self.package}.{name}.agent")
+                    agent_cls = getattr(module, "Agent")
+                except (ImportError, AttributeError) as exc:
+                    logger.warning("Skipping agent package '%s': %s", name, exc)
+                    continue
+                agents[name] = agent_cls
+                agents.setdefault(agent_cls.name, agent_cls)
+                listing.append({"name": agent_cls.name, "description": getattr(agent_cls, "description", "")})
+            self._agents = agents
+            self._listing = listing
+            self._loaded = True
+
+    def get(self, agent_name: str) -> Type[Any]:
+        if not self._loaded:
+            self._discover()
+        try:
+            return self._agents[agent_name]
+        except KeyError:
+            raise ValueError(f"Agent '{agent_name}' not found") from None
+
+    def list(self) -> List[Dict[str, str]]:
+        if not self._loaded:
+            self._discover()
+        return self._listing
+
+    def preload(self) -> None:
+        """Import every agent and parse its RAG assets; called at app and worker startup."""
+        self._discover()
+        for agent_cls in set(self._agents.values()):
+            load_rag_assets(agent_cls.rag_path)
+
+
+agent_registry = AgentRegistry()
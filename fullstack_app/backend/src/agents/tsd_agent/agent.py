@@ -4,18 +4,70 @@ document files or raw text and uses retrieval‑augmented generation (RAG) to
 assemble a structured DOCX document section by section.  Each section is
 defined in the `sections.json` RAG file with a name and style.  Supported
 styles include 'paragraph' for free text and 'table' for tabular output.
+Table sections may list their `columns`; they are requested as JSON matching a
+schema built from those columns and parsed row by row once the reply is
+complete.  Like paragraphs, they go through the LLM response cache and
+single-flight, so reruns reuse earlier replies.
+
+Each section prompt receives only the knowledge and source chunks most relevant
+to that section, retrieved from the agent's RAG index and an index built over
+the uploaded documents.  The document index is built from the raw extracted
+text, and the source chunks of each prompt are capped at
+`CONTEXT_TOKEN_BUDGET` tokens; input is only condensed up front when it is
+passed whole.  Sections are generated concurrently.  The number of in-flight LLM calls is
+bounded by `TSD_SECTION_CONCURRENCY`.  A section whose call fails with a
+transient provider error, or whose table reply has no valid rows, is retried
+up to `TSD_SECTION_RETRIES` times; any other failure, and the last retry,
+writes a placeholder in its place.
+
+Generated sections are memoized on disk under a hash of the section
+definition, its prompt (guidelines and retrieved context chunks) and the model,
+so rerunning the agent after editing one input only regenerates the sections
+whose inputs changed.  Runs started with `force` bypass the memo.
 """
+import asyncio
+import hashlib
+import json
 import os
-from typing import Any, Dict, List, Optional
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
-from ..base import BaseAgent
+from ..base import CONTEXT_TOKEN_BUDGET, BaseAgent
+from ...models.rate_limit import is_retryable
+from ...models.tokens import count_tokens
+from ...rag import RAG_ENABLED, RAG_MIN_CONTEXT_CHARS, RAG_TOP_K, VectorIndex, format_chunks, get_embedder
+from ...services import metrics
 from ...utils.document_extractor import extract_text_from_files
 from ...utils.docx_builder import DocxBuilder
+from ...utils.extraction_cache import ExtractionCache
+from ...utils.structured_output import RowStreamParser, parse_pipe_table, table_schema
+
+
+SECTION_CONCURRENCY = int(os.environ.get("TSD_SECTION_CONCURRENCY", "4"))
+SECTION_RETRIES = int(os.environ.get("TSD_SECTION_RETRIES", "2"))
+SECTION_RETRY_DELAY = float(os.environ.get("TSD_SECTION_RETRY_DELAY", "1.0"))
+
+# Bump when section parsing changes so memoized outputs are regenerated
+SECTION_MEMO_VERSION = "2"
+_DEFAULT_MEMO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "cache", "sections"))
+
+section_memo = ExtractionCache(
+    os.environ.get("TSD_SECTION_MEMO_DIR", _DEFAULT_MEMO_DIR),
+    max_bytes=int(os.environ.get("TSD_SECTION_MEMO_MAX_BYTES", str(256 * 1024 ** 2))),
+    memory_items=0,
+)
+metrics.register_cache("tsd_sections", section_memo.hit_counts)
+
+
+class NoValidRowsError(ValueError):
+    """A table reply from which no valid row could be recovered."""
 
 
 class Agent(BaseAgent):
     name = "tsd"
     description = "Generate a Technical Specification Document (TSD) from source content"
+    rag_path = Path(__file__).resolve().parent / "rag"
+    model_name = "gpt-3.5-turbo"
 
     async def run(self, job_id: str, input_text: Optional[str], files: Optional[List[Dict[str, str]]]) -> Any:
         if not input_text and not files:
@@ -25,42 +77,170 @@ class Agent(BaseAgent):
         context = "\n".join([extracted, input_text or ""]).strip()
         if not self.sections_def:
             # Fallback: generate a simple document
-            text = await self.call_llm(context)
+            text = await self.call_llm(await self.fit_context(job_id, context))
             return {"result": text}
-        # Build sections sequentially
-        section_outputs: List[Dict[str, Any]] = []
+        knowledge = await self.knowledge_index()
+        documents: Optional[VectorIndex] = None
+        if RAG_ENABLED and len(context) > RAG_MIN_CONTEXT_CHARS:
+            # Sections retrieve from the raw text; condensing it first would
+            # cost LLM calls and lose the detail retrieval is meant to keep
+            documents = await asyncio.to_thread(VectorIndex.from_texts, get_embedder(), [("input", context)])
+        else:
+            # Condense oversized input once; every section reuses the result
+            context = await self.fit_context(job_id, context)
+        # Build sections concurrently; outputs are stored by index so the
+        # document keeps the order defined in sections.json.
         total = len(self.sections_def)
-        for idx, section in enumerate(self.sections_def, start=1):
-            title = section.get("name", f"Section {idx}")
-            style = section.get("style", "paragraph")
-            # Compose prompt with guidelines and context
-            prompt = f"Generate {style} content for section '{title}'.\n"
-            if self.guidelines:
-                prompt += f"Guidelines:\n{self.guidelines}\n"
-            prompt += f"Context:\n{context}\n"
-            output = await self.call_llm(prompt)
-            await self.update_progress(job_id, f"Processing section {idx}/{total}: {title}")
-            # Parse table output if style is table; assume pipe-delimited lines
-            content: Any
-            if style == "table":
-                rows: List[Dict[str, str]] = []
-                lines = [line.strip() for line in output.split("\n") if line.strip()]
-                if lines:
-                    headers = [h.strip() for h in lines[0].split("|")]
-                    for row_line in lines[1:]:
-                        values = [v.strip() for v in row_line.split("|")]
-                        row_dict = {headers[i]: values[i] if i < len(values) else "" for i in range(len(headers))}
-                        rows.append(row_dict)
-                content = rows
+        section_outputs: List[Optional[Dict[str, Any]]] = [None] * total
+        semaphore = asyncio.Semaphore(max(1, SECTION_CONCURRENCY))
+        done = 0
+        reused = 0
+
+        async def worker(idx: int, section: Dict[str, Any]) -> None:
+            nonlocal done, reused
+            title = section.get("name", f"Section {idx + 1}")
+            prompt = self._section_prompt(title, section, context, knowledge, documents)
+            key = self._memo_key(section, prompt)
+            output = None if self.force else await self._memo_get(key)
+            if output is not None:
+                reused += 1
+                state = "Reused"
             else:
-                content = output.strip()
-            section_outputs.append({"title": title, "content": content})
+                async with semaphore:
+                    output, ok = await self._generate_section(job_id, section, title, prompt)
+                if ok:
+                    await self._memo_put(key, output)
+                state = "Processed"
+            section_outputs[idx] = output
+            done += 1
+            await self.update_progress(job_id, f"{state} section {done}/{total}: {output['title']}")
+
+        await asyncio.gather(*(worker(idx, section) for idx, section in enumerate(self.sections_def)))
         # Assemble DOCX
         output_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "generated_files"))
         os.makedirs(output_dir, exist_ok=True)
         output_path = os.path.join(output_dir, f"{job_id}.docx")
         builder = DocxBuilder(self.formatting)
-        builder.build(section_outputs, output_path)
+        await builder.build_async([s for s in section_outputs if s is not None], output_path)
         # Return file URL relative to static mount
         file_url = f"/static/{job_id}.docx"
-        return {"file_url": file_url}
\ No newline at end of file
+        return {"file_url": file_url, "sections_reused": reused, "sections_generated": total - reused}
+
+    def _section_prompt(
+        self,
+        title: str,
+        section: Dict[str, Any],
+        context: str,
+        knowledge: Optional[VectorIndex] = None,
+        documents: Optional[VectorIndex] = None,
+    ) -> str:
+        """
+        Compose the prompt of a section.  When indexes are given, only the
+        top-k chunks for the section are included, source chunks up to
+        `CONTEXT_TOKEN_BUDGET` tokens.
+        """
+        style = section.get("style", "paragraph")
+        query = f"{title} {style} {section.get('description', '')}"
+        guidelines = format_chunks(knowledge.search(query, RAG_TOP_K)) if knowledge else self.guidelines
+        if documents is not None:
+            context = format_chunks(self._within_budget(documents.search(query, RAG_TOP_K), CONTEXT_TOKEN_BUDGET))
+        prompt = f"Generate {style} content for section '{title}'.\n"
+        if guidelines:
+            prompt += f"Guidelines:\n{guidelines}\n"
+        prompt += f"Context:\n{context}\n"
+        return prompt
+
+    def _within_budget(self, chunks: List[Dict[str, str]], budget: int) -> List[Dict[str, str]]:
+        """Keep the best-ranked chunks that fit in `budget` tokens, cutting the last one to fit."""
+        kept: List[Dict[str, str]] = []
+        for chunk in chunks:
+            tokens = count_tokens(chunk["text"], self.model_name)
+            if tokens > budget:
+                if budget > 0:
+                    kept.append({**chunk, "text": chunk["text"][: int(len(chunk["text"]) * budget / tokens)]})
+                break
+            kept.append(chunk)
+            budget -= tokens
+        return kept
+
+    def _memo_key(self, section: Dict[str, Any], prompt: str) -> str:
+        payload = json.dumps(
+            {"section": section, "prompt": prompt, "model": self.model_name, "version": SECTION_MEMO_VERSION},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def _memo_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not section_memo.enabled:
+            return None
+        cached = await section_memo.aget(key)
+        return json.loads(cached) if cached is not None else None
+
+    async def _memo_put(self, key: str, output: Dict[str, Any]) -> None:
+        if section_memo.enabled:
+            await section_memo.aput(key, json.dumps(output))
+
+    async def _generate_section(
+        self, job_id: str, section: Dict[str, Any], title: str, prompt: str
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Generate a single section.  Transient provider errors are retried: the
+        provider limiter only retries opening a call, so one that breaks off
+        mid-stream reaches this level.  Table replies without valid rows are
+        re-prompted.  Other errors, such as a prompt over the context window,
+        would fail again and fail the section at once.  A failed section is
+        replaced by a placeholder paragraph so the sections that did succeed
+        are not lost.  Returns the section output and whether generation
+        succeeded.
+        """
+        style = section.get("style", "paragraph")
+        content: Any
+        use_cache = False if self.force else None
+        attempts = max(0, SECTION_RETRIES) + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                if style == "table":
+                    content = await self._generate_table(job_id, title, section, prompt, use_cache)
+                else:
+                    output = await self.call_llm(prompt, model_name=self.model_name, use_cache=use_cache)
+                    content = output.strip()
+                break
+            except Exception as exc:
+                if attempt == attempts or not (is_retryable(exc) or isinstance(exc, NoValidRowsError)):
+                    await self.update_progress(job_id, f"Section '{title}' failed after {attempt} attempts: {exc}")
+                    return {"title": title, "content": f"[Section generation failed: {exc}]"}, False
+                if isinstance(exc, NoValidRowsError):
+                    # The unusable reply is cached; ask the model again
+                    use_cache = False
+                await self.update_progress(job_id, f"Retrying section '{title}' ({attempt}/{attempts - 1}): {exc}")
+                await asyncio.sleep(SECTION_RETRY_DELAY * attempt)
+        return {"title": title, "content": content}, True
+
+    async def _generate_table(
+        self, job_id: str, title: str, section: Dict[str, Any], prompt: str, use_cache: Optional[bool] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Request a table section as JSON and validate its rows.  Malformed rows
+        are repaired where possible; a pipe-delimited reply is accepted as a
+        fallback.  Raises NoValidRowsError (so the section is re-prompted) only
+        when no valid row could be recovered.
+        """
+        columns = section.get("columns")
+        schema = table_schema(columns)
+        prompt += (
+            "Return the table as a JSON object with a `rows` array, one object per row, "
+            f"matching this JSON schema:\n{json.dumps(schema)}\n"
+        )
+        reply = await self.call_llm(prompt, model_name=self.model_name, use_cache=use_cache, schema=schema)
+        parser = RowStreamParser(columns)
+        parser.feed(reply)
+        parser.close()
+        rows = parser.rows or parse_pipe_table(reply, columns)
+        if not rows:
+            raise NoValidRowsError("reply contained no valid table rows")
+        if parser.repaired or parser.invalid:
+            await self.update_progress(
+                job_id, f"Section '{title}': repaired {parser.repaired} and dropped {parser.invalid} malformed rows"
+            )
+        return rows
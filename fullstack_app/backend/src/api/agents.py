@@ -1,66 +1,94 @@
 """
 Agent orchestration endpoints.  Exposes a list of available agents and an endpoint
 to trigger agent execution via the background job system.  Agent run requests
-create a job and dispatch it to Celery.
+create a job and dispatch it to Celery; batch run requests create a parent job
+with one child job per input.
 """
+import os
 from typing import Dict, List, Optional
 
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from ..services.job_manager import job_manager
-from ..agents import load_agent
-from ..tasks import run_agent_task
+from ..agents import agent_registry, load_agent
+from ..tasks import PRIORITY_CLASSES, submit_agent_batch, submit_agent_job
 
 
 router = APIRouter()
 
+MAX_BATCH_ITEMS = int(os.environ.get("MAX_BATCH_ITEMS", "1000"))
+
 
 class AgentRunRequest(BaseModel):
     agent: str
     input_text: Optional[str] = None
     files: Optional[List[Dict[str, str]]] = None
+    priority: Optional[str] = Field(None, description="Priority class: 'interactive' or 'batch'")
+    force: bool = Field(False, description="Regenerate everything instead of reusing memoized results")
+
+
+class AgentBatchItem(BaseModel):
+    input_text: Optional[str] = None
+    files: Optional[List[Dict[str, str]]] = None
+    force: bool = False
+
+
+class AgentBatchRequest(BaseModel):
+    agent: str
+    items: List[AgentBatchItem] = Field(..., description="One entry per agent run")
+    priority: Optional[str] = Field("batch", description="Priority class: 'interactive' or 'batch'")
 
 
 @router.get("/list")
 async def list_agents():
     """
-    Return a list of available agents by introspecting the `src/agents` package.
+    Return a list of available agents from the agent registry.
     """
-    # Discover agent packages by scanning the filesystem
-    import pkg_resources
-    import pkgutil
-    import importlib
-    import os
-    package_dir = os.path.dirname(__file__)
-    agents_dir = os.path.join(package_dir, "..", "agents")
-    agents_list = []
-    for finder, name, ispkg in pkgutil.iter_modules([agents_dir]):
-        if ispkg and not name.startswith("__"):
-            # Attempt to load agent.json for metadata
-            try:
-                module = importlib.import_module(f"src.agents.{name}.agent")
-                agent_cls = getattr(module, "Agent")
-                agents_list.append({"name": agent_cls.name, "description": getattr(agent_cls, "description", "")})
-            except Exception:
-                pass
-    return JSONResponse({"agents": agents_list})
+    return JSONResponse({"agents": agent_registry.list()})
 
 
 @router.post("/run")
 async def run_agent(request: AgentRunRequest):
     """
     Trigger an agent execution.  A job is created and dispatched to the Celery
-    worker; the job ID is returned to the client for polling.
+    queue of the agent and requested priority class; the job ID is returned to
+    the client for polling.
     """
     # Validate agent existence
     try:
         load_agent(request.agent)
     except ValueError:
         raise HTTPException(status_code=404, detail="Agent not found")
+    if request.priority is not None and request.priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority class: {request.priority}")
     # Create job
     job_id = await job_manager.create_job(job_type=request.agent, description=f"Run agent {request.agent}")
     # Kick off Celery task
-    run_agent_task.delay(job_id, request.agent, request.input_text, request.files)
-    return JSONResponse({"job_id": job_id})
\ No newline at end of file
+    submit_agent_job(job_id, request.agent, request.input_text, request.files, request.priority, request.force)
+    return JSONResponse({"job_id": job_id})
+
+
+@router.post("/run-batch")
+async def run_agent_batch(request: AgentBatchRequest):
+    """
+    Trigger one agent execution per item.  A parent job tracks the aggregate
+    progress of the child jobs, which are dispatched together as a Celery
+    chord.  Both the parent and the child job IDs are returned.
+    """
+    try:
+        load_agent(request.agent)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    if len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {MAX_BATCH_ITEMS} items")
+    if request.priority is not None and request.priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority class: {request.priority}")
+    parent_id, child_ids = await job_manager.create_batch(
+        request.agent, len(request.items), description=f"Run agent {request.agent} on {len(request.items)} inputs"
+    )
+    submit_agent_batch(parent_id, child_ids, request.agent, [item.dict() for item in request.items], request.priority)
+    return JSONResponse({"job_id": parent_id, "child_job_ids": child_ids})
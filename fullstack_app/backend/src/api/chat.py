@@ -3,17 +3,29 @@ Chat completion endpoints.  These routes handle normal conversation mode
 without invoking any agents.  Clients can specify the model provider and name.
 Streaming via Server‑Sent Events (SSE) is supported for progressive token output.
 """
-from typing import Any, Dict, List, Optional
+import asyncio
+import os
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel, Field
 
 from ..models.providers import get_model
+from ..models.response_cache import generate
+from ..utils.sse import format_sse
 
 
 router = APIRouter()
 
+# Seconds without a token after which a heartbeat event is sent
+HEARTBEAT_INTERVAL = float(os.environ.get("SSE_HEARTBEAT_INTERVAL", "15"))
+
+# Hedge chat requests across the targets of multi-provider routes
+CHAT_HEDGING = os.environ.get("CHAT_HEDGING", "0") == "1"
+
+_STREAM_END = object()
+
 
 class ChatMessage(BaseModel):
     role: str
@@ -26,29 +38,77 @@ class ChatRequest(BaseModel):
     stream: bool = Field(False, description="Whether to stream responses via SSE")
 
 
-async def generate_completion(messages: List[Dict[str, str]], model_name: str) -> str:
+def _build_prompt(messages: List[Dict[str, str]]) -> str:
     # Flatten messages into a prompt; for demonstration we simply join user messages
-    prompt = "\n".join([m["content"] for m in messages if m["role"] == "user"])
-    model = get_model(model_name)
-    return await model.generate(prompt)
+    return "\n".join([m["content"] for m in messages if m["role"] == "user"])
+
+
+async def generate_completion(messages: List[Dict[str, str]], model_name: str) -> str:
+    model = get_model(model_name, hedge=CHAT_HEDGING)
+    prompt = _build_prompt(messages)
+    return await generate(model, model_name, prompt)
+
+
+def stream_completion(messages: List[Dict[str, str]], model_name: str) -> AsyncIterator[str]:
+    model = get_model(model_name, hedge=CHAT_HEDGING)
+    return model.stream(_build_prompt(messages))
+
+
+async def _token_events(request: Request, tokens: AsyncIterator[str]) -> AsyncGenerator[str, None]:
+    """
+    Forward tokens as SSE events as soon as they arrive.  The upstream iterator
+    is consumed by a separate task so heartbeats can be interleaved while the
+    model is thinking; the task is cancelled (aborting the upstream request)
+    when the client disconnects or the response is closed.
+    """
+    queue: "asyncio.Queue[Any]" = asyncio.Queue()
+
+    async def pump() -> None:
+        try:
+            async for token in tokens:
+                await queue.put(token)
+        except Exception as exc:  # surfaced to the client as an error event
+            await queue.put(exc)
+        finally:
+            await queue.put(_STREAM_END)
+
+    producer = asyncio.create_task(pump())
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield format_sse("", event="heartbeat")
+                continue
+            if item is _STREAM_END:
+                yield format_sse("[DONE]")
+                break
+            if isinstance(item, Exception):
+                yield format_sse(str(item), event="error")
+                break
+            yield format_sse(item)
+    finally:
+        producer.cancel()
+        try:
+            await producer
+        except (asyncio.CancelledError, Exception):
+            pass
 
 
 @router.post("/completions")
-async def chat_completions(request: ChatRequest):
+async def chat_completions(request: ChatRequest, http_request: Request):
     """
     Generate a chat completion.  If `stream` is true, return a streaming response
     that yields tokens as they become available.
     """
     try:
         if request.stream:
-            async def event_generator():
-                text = await generate_completion([m.dict() for m in request.messages], request.model)
-                # Simple streaming: yield each sentence as a separate SSE event
-                for chunk in text.split(". "):
-                    yield f"data: {chunk}\n\n"
-            return StreamingResponse(event_generator(), media_type="text/event-stream")
+            tokens = stream_completion([m.dict() for m in request.messages], request.model)
+            return StreamingResponse(_token_events(http_request, tokens), media_type="text/event-stream")
         else:
             text = await generate_completion([m.dict() for m in request.messages], request.model)
             return JSONResponse({"result": text})
     except Exception as exc:
-        raise HTTPException(status_code=500, detail=str(exc))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(exc))
@@ -2,14 +2,36 @@
 File upload API.  Handles receiving user files, validating MIME types, and
 storing them on disk.  Returns metadata needed by the agent pipeline.  Also
 exposes an endpoint to list supported file types for tooltips on the client.
+
+Uploads are copied to disk in chunks without blocking the event loop and
+hashed while they are written.  Files are stored under their SHA-256 digest,
+so identical uploads share one copy, and the digest is returned so later
+stages (e.g. the extraction cache) can use it as a key.
+
+`MAX_UPLOAD_REQUEST_BYTES` is enforced by `UploadSizeLimit` while the body is
+still being received, before the multipart form is parsed and spooled to
+temporary files.  `MAX_UPLOAD_FILE_BYTES` can only be checked once the form
+has been parsed, so a single file may be buffered up to the request limit
+before it is rejected.
+
+Text extraction of each stored file is queued on the Celery workers right
+away (disable with `PRE_EXTRACT_UPLOADS=0` or `?extract=false`), so agent runs
+on the upload find it cached or already in progress.
 """
+import hashlib
 import os
-import shutil
-from typing import List
+import uuid
+from typing import Any, Dict, List, Optional
 
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import aiofiles
+import aiofiles.os
 from fastapi import APIRouter, File, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
 
+from ..tasks import submit_extraction
+
 router = APIRouter()
 
 SUPPORTED_TYPES = {
@@ -24,6 +46,11 @@ SUPPORTED_TYPES = {
 UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "uploaded_files"))
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+MAX_FILE_BYTES = int(os.environ.get("MAX_UPLOAD_FILE_BYTES", str(50 * 1024 * 1024)))
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_UPLOAD_REQUEST_BYTES", str(200 * 1024 * 1024)))
+CHUNK_SIZE = 1024 * 1024
+PRE_EXTRACT = os.environ.get("PRE_EXTRACT_UPLOADS", "1") == "1"
+
 
 @router.get("/types")
 async def get_supported_types():
@@ -31,27 +58,93 @@ async def get_supported_types():
     return JSONResponse({"supported_types": list(SUPPORTED_TYPES.keys())})
 
 
+class UploadSizeLimit:
+    """
+    ASGI middleware that answers 413 to requests for `path` whose body is
+    larger than `MAX_REQUEST_BYTES`, judged by `Content-Length` up front and
+    by counting the bytes as they arrive.
+    """
+
+    def __init__(self, app: ASGIApp, path: str) -> None:
+        self.app = app
+        self.path = path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > MAX_REQUEST_BYTES:
+            await JSONResponse({"detail": "Upload request too large"}, status_code=413)(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_REQUEST_BYTES:
+                    raise HTTPException(status_code=413, detail="Upload request too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def _store_upload(file: UploadFile, file_ext: str) -> Dict[str, Any]:
+    """
+    Copy a received upload to a temporary file while hashing it, then move it
+    to its content-addressed location.  Raises 413 as soon as the file
+    exceeds the per-file limit.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = os.path.join(UPLOAD_DIR, f".{uuid.uuid4().hex}.part")
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out_file:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_FILE_BYTES:
+                    raise HTTPException(status_code=413, detail=f"File too large: {file.filename}")
+                digest.update(chunk)
+                await out_file.write(chunk)
+        sha256 = digest.hexdigest()
+        dest_path = os.path.join(UPLOAD_DIR, f"{sha256}{file_ext}")
+        # Identical content is already stored; keep the existing copy
+        if await aiofiles.os.path.exists(dest_path):
+            await aiofiles.os.remove(tmp_path)
+        else:
+            await aiofiles.os.replace(tmp_path, dest_path)
+    except BaseException:
+        if await aiofiles.os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+        raise
+    return {"path": dest_path, "sha256": sha256, "size": size}
+
+
 @router.post("/upload")
-async def upload_files(files: List[UploadFile] = File(...)):
+async def upload_files(files: List[UploadFile] = File(...), extract: Optional[bool] = None):
     """
     Upload one or more files.  Unsupported file types are rejected.  The files
     are stored in the server's upload directory and returned with metadata.
+    Unless `extract` is false, text extraction is queued in the background.
     """
-    metadata = []
+    if extract is None:
+        extract = PRE_EXTRACT
+    # Validate every file before storing any of them
     for file in files:
         if file.content_type not in SUPPORTED_TYPES:
             raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.content_type}")
-        # Save file to disk
+        if file.size is not None and file.size > MAX_FILE_BYTES:
+            raise HTTPException(status_code=413, detail=f"File too large: {file.filename}")
+    metadata = []
+    for file in files:
         file_ext = SUPPORTED_TYPES[file.content_type]
         file_name = file.filename or f"upload{file_ext}"
-        dest_path = os.path.join(UPLOAD_DIR, file_name)
-        # Avoid collisions
-        base, ext = os.path.splitext(dest_path)
-        counter = 1
-        while os.path.exists(dest_path):
-            dest_path = f"{base}_{counter}{ext}"
-            counter += 1
-        with open(dest_path, "wb") as out_file:
-            shutil.copyfileobj(file.file, out_file)
-        metadata.append({"filename": file_name, "path": dest_path, "content_type": file.content_type})
-    return JSONResponse({"files": metadata})
\ No newline at end of file
+        stored = await _store_upload(file, file_ext)
+        extracting = extract and submit_extraction(stored["path"], file.content_type, stored["sha256"])
+        metadata.append({"filename": file_name, "content_type": file.content_type, **stored, "extracting": extracting})
+    return JSONResponse({"files": metadata})
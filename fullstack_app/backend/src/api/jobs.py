@@ -1,52 +1,72 @@
 """
 Job status API.  The frontend queries this endpoint to obtain the status of
 background tasks such as agent execution.  Supports optional Server‑Sent Events
-for live updates.
+for live updates, and cancellation of running or queued jobs.
 """
-from typing import AsyncGenerator, Dict, Optional
+import json
+import os
+from typing import AsyncGenerator, Optional
 
-import asyncio
-
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
 from fastapi.responses import StreamingResponse, JSONResponse
 
-from ..services.job_manager import job_manager
+from ..services.job_manager import JobStatus, job_manager
+from ..utils.sse import format_sse
 
 
 router = APIRouter()
 
+# Seconds without job activity after which a heartbeat event is sent
+HEARTBEAT_INTERVAL = float(os.environ.get("SSE_HEARTBEAT_INTERVAL", "15"))
+
 
 @router.get("/{job_id}")
-async def get_job_status(job_id: str, stream: bool = False):
+async def get_job_status(job_id: str, stream: bool = False, last_event_id: Optional[str] = Header(None)):
     """
     Return the current status of a job.  If `stream` is true, stream updates
-    whenever the job changes.  Streaming terminates when the job completes or
-    fails.
+    whenever the job changes.  Each log line is sent once, with its position as
+    the event ID, so a reconnecting client that sends `Last-Event-ID` only
+    receives the lines it missed.  Streaming terminates when the job completes
+    or fails.
     """
     job = await job_manager.get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     if stream:
+        try:
+            after = max(0, int(last_event_id)) if last_event_id else 0
+        except ValueError:
+            after = 0
+
         async def event_generator() -> AsyncGenerator[str, None]:
-            current_logs_len = 0
-            while True:
-                job_state = await job_manager.get_job(job_id)
-                if not job_state:
-                    break
-                # Send new log lines as they appear
-                logs = job_state["logs"]
-                if len(logs) > current_logs_len:
-                    for line in logs[current_logs_len:]:
-                        yield f"data: {line}\n\n"
-                    current_logs_len = len(logs)
-                if job_state["status"] in ("completed", "failed"):
-                    # Final state; send result as a final event
-                    import json
+            async for event in job_manager.subscribe(job_id, after=after, heartbeat=HEARTBEAT_INTERVAL):
+                if event["type"] == "log":
+                    yield format_sse(event["log"], event_id=event["id"])
+                elif event["type"] == "status":
+                    yield format_sse(json.dumps({"status": event["status"]}), event="status", event_id=event["id"])
+                elif event["type"] == "heartbeat":
+                    yield format_sse("", event="heartbeat")
+                elif event["type"] == "final":
                     # Send final state as JSON string inside SSE data field
-                    payload = json.dumps({"status": job_state["status"], "result": job_state["result"]})
-                    yield f"data: {payload}\n\n"
-                    break
-                await asyncio.sleep(0.5)
+                    payload = json.dumps({"status": event["status"], "result": event["result"]})
+                    yield format_sse(payload, event_id=event["id"])
         return StreamingResponse(event_generator(), media_type="text/event-stream")
     else:
-        return JSONResponse(job)
\ No newline at end of file
+        return JSONResponse(job)
+
+
+@router.delete("/{job_id}")
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    Cancel a job.  A queued job is skipped when a worker picks it up; a running
+    job's agent is interrupted, aborting its in-flight model requests.
+    Cancelling a batch cancels its unfinished children.  Returns 409 if the
+    job has already finished.
+    """
+    job = await job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not await job_manager.cancel_job(job_id):
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return JSONResponse({"job_id": job_id, "status": JobStatus.CANCELLED})
@@ -0,0 +1,59 @@
+"""
+Metrics API.  Serves the process's performance metrics (see
+`services.metrics`) in the Prometheus text format for scraping, and provides
+the `RequestTimer` middleware that records API request latency.
+"""
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..services import metrics
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    """Return every metric of this API process."""
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+class RequestTimer:
+    """
+    ASGI middleware recording every HTTP request in `http_request_seconds`.
+    A request is timed until the application returns, which is after the
+    last body chunk was sent, so streamed responses (SSE job updates, chat
+    streams) count their full duration.  Requests that fail before a
+    response starts are recorded with status 500.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Label by route template, so path parameters do not multiply series
+            route = scope.get("route")
+            metrics.HTTP_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
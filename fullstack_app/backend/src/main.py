@@ -2,7 +2,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from src.api import chat, agents, jobs, files
+# Importing the Celery app configures the broker and queues that jobs are
+# dispatched to
+import celery_app  # noqa: F401
+from src.api import chat, agents, jobs, files, metrics as metrics_api
+from src.agents import agent_registry
+from src.models.providers import close_providers
+from src.services import metrics
 
 
 def create_app() -> FastAPI:
@@ -29,6 +35,8 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    # Reject oversize uploads before their multipart body is parsed
+    app.add_middleware(files.UploadSizeLimit, path="/files/upload")
 
     # Mount static directory for serving generated files (e.g., DOCX outputs)
     app.mount("/static", StaticFiles(directory="generated_files"), name="static")
@@ -38,6 +46,14 @@ def create_app() -> FastAPI:
     app.include_router(agents.router, prefix="/agent", tags=["Agents"])
     app.include_router(jobs.router, prefix="/job", tags=["Jobs"])
     app.include_router(files.router, prefix="/files", tags=["Files"])
+    if metrics.METRICS_ENABLED:
+        app.include_router(metrics_api.router, tags=["Metrics"])
+        app.add_middleware(metrics_api.RequestTimer)
+
+    # Discover agents and parse their RAG assets once, before serving requests
+    app.add_event_handler("startup", agent_registry.preload)
+    # Release pooled provider connections on shutdown
+    app.add_event_handler("shutdown", close_providers)
 
     return app
 
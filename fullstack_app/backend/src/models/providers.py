@@ -2,46 +2,377 @@
 Model provider registry.  Providers abstract away the details of communicating
 with external language model APIs (OpenAI, Anthropic, etc.).  Each provider
 implements an asynchronous `generate` method that takes a prompt and returns
-generated text.
+generated text, and a `stream` method that yields text deltas as the upstream
+API produces them.
+
+Model names select the provider by prefix: `gpt*` (OpenAI), `claude*`
+(Anthropic), `azure/<deployment>` (Azure OpenAI) and `local/<model>` (any
+OpenAI-compatible server at `LOCAL_LLM_BASE_URL`).  Names listed in
+`LLM_ROUTES` resolve to a `RoutedProvider` spreading requests over several of
+these targets (see `router.py`).
+
+Provider instances are cached per model name and share one long-lived HTTP
+client per provider, so connections (keep-alive, HTTP/2 when the `h2` package
+is installed) are reused across requests in both the API process and the
+Celery workers.  Pool limits and timeouts are configured via environment
+variables:
+
+  * `LLM_MAX_CONNECTIONS` – maximum open connections per provider (default 100)
+  * `LLM_MAX_KEEPALIVE` – maximum idle keep-alive connections (default 20)
+  * `LLM_KEEPALIVE_EXPIRY` – seconds an idle connection is kept (default 30)
+  * `LLM_TIMEOUT` – overall request timeout in seconds (default 120)
+  * `LLM_CONNECT_TIMEOUT` – connect timeout in seconds (default 10)
+  * `LLM_HTTP2` – set to `0` to disable HTTP/2 negotiation
 """
+import asyncio
+import json
 import os
-from typing import Dict, Protocol, Any
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Protocol, Tuple
+
+import httpx
 import openai
 
+from .rate_limit import get_limiter
+from .router import RoutedProvider, load_routes
+from .tokens import context_window, count_tokens
+
 
 class Provider(Protocol):
     async def generate(self, prompt: str) -> str:
         ...
 
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Yield generated text incrementally.  Closing the iterator (or cancelling
+        the task consuming it) aborts the upstream request.
+        """
+        ...
+
+    def stream_structured(self, prompt: str, schema: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Like `stream`, but ask for a JSON value matching `schema` (through
+        function calling where the API supports it) and yield its text.
+        """
+        ...
+
+
+def _http2_available() -> bool:
+    if os.environ.get("LLM_HTTP2", "1") == "0":
+        return False
+    try:
+        import h2  # type: ignore  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _SharedClient:
+    """
+    Holds one `httpx.AsyncClient` per provider.  httpx clients are bound to the
+    event loop they were first used on, so the client is rebuilt if it is
+    requested from a different loop.
+    """
+
+    def __init__(self) -> None:
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            limits = httpx.Limits(
+                max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.environ.get("LLM_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "30")),
+            )
+            timeout = httpx.Timeout(
+                float(os.environ.get("LLM_TIMEOUT", "120")),
+                connect=float(os.environ.get("LLM_CONNECT_TIMEOUT", "10")),
+            )
+            self._client = httpx.AsyncClient(limits=limits, timeout=timeout, http2=_http2_available())
+            self._loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
 
 class OpenAIProvider:
+    provider_name = "openai"
+    _http = _SharedClient()
+
     def __init__(self, model_name: str = "gpt-3.5-turbo") -> None:
-        openai.api_key = os.environ.get("OPENAI_API_KEY", "")
         self.model_name = model_name
+        self.temperature = 0.6
+        self.max_tokens = 1024
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
 
-    async def generate(self, prompt: str) -> str:
-        response = await openai.ChatCompletion.acreate(
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        http_client = self._http.get()
+        if self._client is None or self._http_client is not http_client:
+            self._client = self._make_client(http_client)
+            self._http_client = http_client
+        return self._client
+
+    def _make_client(self, http_client: httpx.AsyncClient) -> openai.AsyncOpenAI:
+        return openai.AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY", ""),
+            http_client=http_client,
+            # Retries are handled by the provider limiter
+            max_retries=0,
+        )
+
+    @property
+    def sampling_params(self) -> Dict[str, Any]:
+        return {"temperature": self.temperature, "max_tokens": self.max_tokens}
+
+    def _completion_budget(self, prompt: str) -> int:
+        """
+        Return the completion token limit that fits in the model's context
+        window next to `prompt`.  Raises ValueError if the prompt alone does not.
+        """
+        available = context_window(self.model_name) - count_tokens(prompt, self.model_name)
+        if available <= 0:
+            raise ValueError(f"Prompt exceeds the context window of '{self.model_name}'")
+        return min(self.max_tokens, available)
+
+    async def _create(self, prompt: str, stream: bool = False, **params: Any) -> Any:
+        return await self.client.chat.completions.create(
             model=self.model_name,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.6,
-            max_tokens=1024,
+            temperature=self.temperature,
+            max_tokens=self._completion_budget(prompt),
+            stream=stream,
+            **params,
         )
-        return response.choices[0].message.content
+
+    async def generate(self, prompt: str) -> str:
+        limiter = get_limiter(self.provider_name, self.model_name)
+        response = await limiter.call(lambda: self._create(prompt))
+        return response.choices[0].message.content or ""
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        limiter = get_limiter(self.provider_name, self.model_name)
+        async with limiter.stream(lambda: self._create(prompt, stream=True)) as response:
+            try:
+                async for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+            finally:
+                # Release the connection immediately when the consumer stops early
+                await response.response.aclose()
+
+    async def stream_structured(self, prompt: str, schema: Dict[str, Any]) -> AsyncIterator[str]:
+        # A forced function call makes the model emit arguments matching the schema
+        tool = {"type": "function", "function": {"name": "emit", "parameters": schema}}
+        limiter = get_limiter(self.provider_name, self.model_name)
+        opened = limiter.stream(
+            lambda: self._create(
+                prompt, stream=True, tools=[tool], tool_choice={"type": "function", "function": {"name": "emit"}}
+            )
+        )
+        async with opened as response:
+            try:
+                async for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    for call in delta.tool_calls or ():
+                        if call.function and call.function.arguments:
+                            yield call.function.arguments
+                    # Servers without tool support answer in plain content
+                    if delta.content:
+                        yield delta.content
+            finally:
+                await response.response.aclose()
+
+    @classmethod
+    async def aclose(cls) -> None:
+        await cls._http.aclose()
+
+
+class AzureOpenAIProvider(OpenAIProvider):
+    """Azure OpenAI deployment, addressed as `azure/<deployment>`."""
+
+    provider_name = "azure"
+
+    def __init__(self, model_name: str) -> None:
+        super().__init__(model_name.split("/", 1)[-1])
+
+    def _make_client(self, http_client: httpx.AsyncClient) -> openai.AsyncOpenAI:
+        return openai.AsyncAzureOpenAI(
+            api_key=os.environ.get("AZURE_OPENAI_API_KEY", ""),
+            azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT", ""),
+            api_version=os.environ.get("AZURE_OPENAI_API_VERSION", "2023-12-01-preview"),
+            http_client=http_client,
+            max_retries=0,
+        )
+
+
+class LocalOpenAIProvider(OpenAIProvider):
+    """OpenAI-compatible server (vLLM, llama.cpp, Ollama...), addressed as `local/<model>`."""
+
+    provider_name = "local"
+
+    def __init__(self, model_name: str) -> None:
+        super().__init__(model_name.split("/", 1)[-1])
+
+    def _make_client(self, http_client: httpx.AsyncClient) -> openai.AsyncOpenAI:
+        return openai.AsyncOpenAI(
+            api_key=os.environ.get("LOCAL_LLM_API_KEY", "local"),
+            base_url=os.environ.get("LOCAL_LLM_BASE_URL", "http://localhost:8000/v1"),
+            http_client=http_client,
+            max_retries=0,
+        )
+
+
+class AnthropicProvider:
+    """Anthropic Messages API, called over the shared HTTP client."""
+
+    provider_name = "anthropic"
+    _http = _SharedClient()
+
+    def __init__(self, model_name: str = "claude-3-haiku-20240307") -> None:
+        self.model_name = model_name
+        self.temperature = 0.6
+        self.max_tokens = 1024
+        self.url = os.environ.get("ANTHROPIC_BASE_URL", "https://api.anthropic.com") + "/v1/messages"
+
+    def _request(self, prompt: str, stream: bool = False) -> httpx.Request:
+        return self._http.get().build_request(
+            "POST",
+            self.url,
+            headers={
+                "x-api-key": os.environ.get("ANTHROPIC_API_KEY", ""),
+                "anthropic-version": "2023-06-01",
+            },
+            json={
+                "model": self.model_name,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": self.temperature,
+                "max_tokens": self.max_tokens,
+                "stream": stream,
+            },
+        )
+
+    async def _send(self, prompt: str, stream: bool = False) -> httpx.Response:
+        response = await self._http.get().send(self._request(prompt, stream), stream=stream)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            response.raise_for_status()
+        return response
+
+    async def generate(self, prompt: str) -> str:
+        limiter = get_limiter(self.provider_name, self.model_name)
+        response = await limiter.call(lambda: self._send(prompt))
+        blocks = response.json().get("content", [])
+        return "".join(block.get("text", "") for block in blocks if block.get("type") == "text")
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        limiter = get_limiter(self.provider_name, self.model_name)
+        async with limiter.stream(lambda: self._send(prompt, stream=True)) as response:
+            try:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[5:])
+                    if event.get("type") == "content_block_delta":
+                        delta = event.get("delta", {}).get("text")
+                        if delta:
+                            yield delta
+                    elif event.get("type") == "message_stop":
+                        break
+            finally:
+                await response.aclose()
+
+    def stream_structured(self, prompt: str, schema: Dict[str, Any]) -> AsyncIterator[str]:
+        # The prompt carries the schema; the reply is parsed leniently
+        return self.stream(prompt)
+
+    @classmethod
+    async def aclose(cls) -> None:
+        await cls._http.aclose()
 
 
 # Registry for available providers
 _providers: Dict[str, Any] = {
     "openai": OpenAIProvider,
-    # Future providers can be added here (Anthropic, Gemini, etc.)
+    "azure": AzureOpenAIProvider,
+    "local": LocalOpenAIProvider,
+    "anthropic": AnthropicProvider,
 }
 
+# Provider prefixes checked by `get_model`, in order
+_prefixes: Tuple[Tuple[str, str], ...] = (
+    ("gpt", "openai"),
+    ("claude", "anthropic"),
+    ("azure/", "azure"),
+    ("local/", "local"),
+)
+
+# Logical model names served by several providers
+_routes: Dict[str, List[str]] = load_routes()
+
+_instances: Dict[Tuple[str, str], Provider] = {}
+_instances_lock = threading.Lock()
+
+
+def _resolve(model_name: str) -> Tuple[str, Callable[[str], Provider]]:
+    for prefix, provider_name in _prefixes:
+        if model_name.startswith(prefix):
+            return provider_name, _providers[provider_name]
+    # Add more prefixes above for other providers
+    raise ValueError(f"No provider found for model '{model_name}'")
+
+
+def get_model(model_name: str, hedge: bool = False) -> Provider:
+    """
+    Return the shared provider instance for a model name.  For example, model
+    names starting with 'gpt' use OpenAI.  Instances are created once per
+    process and reused by every caller.  `hedge` enables hedged requests when
+    the name is a multi-provider route.
+    """
+    targets = _routes.get(model_name)
+    if targets is not None:
+        key = ("router" if not hedge else "router+hedge", model_name)
+        provider = _instances.get(key)
+        if provider is None:
+            routed = RoutedProvider(model_name, [(target, _direct(target)) for target in targets], hedge=hedge)
+            with _instances_lock:
+                provider = _instances.setdefault(key, routed)
+        return provider
+    return _direct(model_name)
+
+
+def _direct(model_name: str) -> Provider:
+    provider_name, provider_cls = _resolve(model_name)
+    key = (provider_name, model_name)
+    provider = _instances.get(key)
+    if provider is None:
+        with _instances_lock:
+            provider = _instances.get(key)
+            if provider is None:
+                provider = provider_cls(model_name)
+                _instances[key] = provider
+    return provider
+
 
-def get_model(model_name: str) -> Provider:
+async def close_providers() -> None:
     """
-    Return an instance of the appropriate provider class based on the model name.
-    For example, model names starting with 'gpt' use OpenAI.
+    Close the pooled HTTP clients of all registered providers.  Called on
+    application shutdown.
     """
-    if model_name.startswith("gpt"):
-        return OpenAIProvider(model_name)
-    # Add more conditional branches for other providers
-    raise ValueError(f"No provider found for model '{model_name}'")
\ No newline at end of file
+    for provider_cls in _providers.values():
+        aclose = getattr(provider_cls, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,266 @@
+"""
+Rate limiting, adaptive concurrency and retries for model provider calls.
+
+Every provider/model pair gets a `ProviderLimiter` that combines:
+
+  * a token bucket of `LLM_RATE_LIMIT_RPS` requests per second (0 disables it),
+    shared by all processes through Redis and falling back to a local bucket
+    when Redis is unreachable;
+  * an AIMD concurrency limit that starts at `LLM_MAX_CONCURRENCY`: a 429 or
+    5xx response, or a stream whose first response takes longer than
+    `LLM_LATENCY_TARGET` seconds, halves it (down to 1), and each success
+    raises it again additively;
+  * retries of rate-limit, timeout, connection and 5xx errors with jittered
+    exponential backoff (`LLM_MAX_RETRIES`), waiting at least as long as the
+    provider's `Retry-After` header asks.
+
+Streams are opened with `ProviderLimiter.stream`, which holds the concurrency
+slot until the stream is closed, so streaming load counts against the limit.
+Total completion and stream durations depend on output length rather than
+provider load, so they never lower the limit; only the time until a stream
+opens does.  Only opening a call or stream is retried; errors in the middle
+of a stream reach the caller.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+import openai
+import redis.asyncio as aioredis
+
+from ..services.redis_client import LoopLocalRedis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RATE_LIMIT_RPS = float(os.environ.get("LLM_RATE_LIMIT_RPS", "0"))
+RATE_LIMIT_BURST = float(os.environ.get("LLM_RATE_LIMIT_BURST", str(max(1.0, RATE_LIMIT_RPS))))
+MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+LATENCY_TARGET = float(os.environ.get("LLM_LATENCY_TARGET", "10"))
+MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "30"))
+
+_RETRYABLE = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    httpx.TransportError,
+)
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, _RETRYABLE):
+        return True
+    # Providers called with plain httpx raise HTTPStatusError
+    status = _status(exc)
+    return isinstance(exc, httpx.HTTPStatusError) and status is not None and (status == 429 or status >= 500)
+
+
+def is_overloaded(exc: BaseException) -> bool:
+    """Whether the provider rejected a call because it is throttling or failing (429 or 5xx)."""
+    status = _status(exc)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Return the delay requested by a `Retry-After` header, if any."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, exc: BaseException) -> float:
+    """Full-jitter exponential backoff, never shorter than `Retry-After`."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+    requested = retry_after(exc)
+    return max(delay, requested) if requested is not None else delay
+
+
+class LocalTokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token; return how long to wait before using it (0 if available now)."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+# Shared token bucket.  KEYS: bucket hash.  ARGV: rate, capacity.  Returns the
+# seconds to wait (as a string) after taking a token.
+_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+if tokens >= 0 then
+  return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+
+class RedisTokenBucket:
+    def __init__(self, url: str, key: str, rate: float, capacity: float) -> None:
+        self.url = url
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self._local = LocalTokenBucket(rate, capacity)
+        self._redis = LoopLocalRedis(url, decode_responses=True, socket_timeout=1)
+        self._retry_redis_at = 0.0
+
+    @property
+    def client(self) -> aioredis.Redis:
+        return self._redis.get()
+
+    async def reserve(self) -> float:
+        if time.monotonic() >= self._retry_redis_at:
+            try:
+                return float(await self.client.eval(_BUCKET_SCRIPT, 1, self.key, self.rate, self.capacity))
+            except (aioredis.RedisError, OSError) as exc:
+                logger.warning("Shared rate limiter unavailable, using local bucket: %s", exc)
+                self._retry_redis_at = time.monotonic() + 30
+        return self._local.reserve()
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight requests."""
+
+    def __init__(self, initial: float, minimum: float = 1.0, maximum: float = 64.0) -> None:
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+        return self._condition
+
+    async def acquire(self) -> None:
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, ok: bool, overloaded: bool = False, first_response: Optional[float] = None) -> None:
+        """
+        Free a slot.  `overloaded` and a `first_response` time above
+        `LATENCY_TARGET` halve the limit; otherwise an `ok` call raises it.
+        """
+        async with self.condition:
+            self.in_flight -= 1
+            if overloaded or (first_response is not None and first_response > LATENCY_TARGET):
+                self.limit = max(self.minimum, self.limit / 2)
+            elif ok:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class ProviderLimiter:
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.concurrency = AdaptiveConcurrency(initial=float(MAX_CONCURRENCY), maximum=float(MAX_CONCURRENCY))
+        self.bucket: Optional[RedisTokenBucket] = None
+        if RATE_LIMIT_RPS > 0:
+            url = os.environ.get("RATE_LIMIT_REDIS_URL") or os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
+            self.bucket = RedisTokenBucket(url, f"ratelimit:{key}", RATE_LIMIT_RPS, RATE_LIMIT_BURST)
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run `fn` under the rate and concurrency limits, retrying transient errors."""
+        result, _ = await self._run(fn, hold=False)
+        return result
+
+    @asynccontextmanager
+    async def stream(self, fn: Callable[[], Awaitable[T]]) -> AsyncIterator[T]:
+        """
+        Open a stream with `fn` like `call` and keep its concurrency slot until
+        the context exits.  Only opening is retried; tokens are not replayed.
+        The time `fn` took to open the stream is the latency the limit adapts to.
+        """
+        stream, first_response = await self._run(fn, hold=True)
+        try:
+            yield stream
+        except BaseException as exc:
+            await self.concurrency.release(False, overloaded=is_overloaded(exc), first_response=first_response)
+            raise
+        await self.concurrency.release(True, first_response=first_response)
+
+    async def _run(self, fn: Callable[[], Awaitable[T]], hold: bool) -> Tuple[T, float]:
+        """
+        Run `fn` with retries; return its result and how long it took.  With
+        `hold` the concurrency slot stays taken after success and the caller
+        must release it.
+        """
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                wait = await self.bucket.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            await self.concurrency.acquire()
+            started = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as exc:
+                await self.concurrency.release(False, overloaded=is_overloaded(exc))
+                if not is_retryable(exc) or attempt >= MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, exc)
+                attempt += 1
+                logger.info("Retrying %s in %.2fs (attempt %d/%d): %s", self.key, delay, attempt, MAX_RETRIES, exc)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                await self.concurrency.release(False)
+                raise
+            if not hold:
+                await self.concurrency.release(True)
+            return result, time.monotonic() - started
+
+
+_limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+
+
+def get_limiter(provider: str, model_name: str) -> ProviderLimiter:
+    """Return the process-wide limiter of a provider/model pair."""
+    key = (provider, model_name)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters.setdefault(key, ProviderLimiter(f"{provider}:{model_name}"))
+    return limiter
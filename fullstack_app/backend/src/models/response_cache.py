@@ -0,0 +1,255 @@
+"""
+Response cache for language model calls.  Completions are keyed on the model
+name, the normalized prompt and the provider's sampling parameters, so a
+byte-identical request (e.g. regenerating a TSD from the same document) is
+answered without calling the provider.
+
+The cache has an in-process LRU tier and an optional shared tier in Redis or
+SQLite, selected with environment variables:
+
+  * `LLM_CACHE` – `memory` (default), `redis`, `sqlite` or `off`
+  * `LLM_CACHE_TTL` – entry lifetime in seconds (default 86400)
+  * `LLM_CACHE_MAX_ITEMS` – size of the in-memory LRU (default 1024)
+  * `LLM_CACHE_URL` – Redis URL for the `redis` tier (default: broker URL)
+  * `LLM_CACHE_PATH` – database file for the `sqlite` tier
+
+Concurrent identical requests are coalesced into one provider call through
+the `llm` single-flight group, whether or not the cache is enabled; use the
+module-level `generate` rather than calling the provider directly.  Structured
+requests (a JSON reply matching a schema) go through the same path, with the
+schema as part of the key, and are read from `stream_structured` to the end.
+Provider calls made through it are recorded in the per-model latency and token
+metrics.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from .tokens import count_tokens
+from ..services import metrics
+from ..services.redis_client import LoopLocalRedis
+from ..services.single_flight import get_single_flight
+
+_llm_flight = get_single_flight("llm")
+
+
+async def _complete(model: Any, prompt: str, schema: Optional[Dict[str, Any]]) -> str:
+    """
+    Return the model's reply to `prompt`.  With `schema`, the JSON reply is
+    collected from `stream_structured`; providers without it answer in plain
+    text.
+    """
+    stream_structured = getattr(model, "stream_structured", None)
+    if schema is None or stream_structured is None:
+        return await model.generate(prompt)
+    return "".join([delta async for delta in stream_structured(prompt, schema)])
+
+
+async def _call_provider(model: Any, model_name: str, prompt: str, schema: Optional[Dict[str, Any]] = None) -> str:
+    """Call the model and record its latency and token counts."""
+    if not metrics.METRICS_ENABLED:
+        return await _complete(model, prompt, schema)
+    started = time.perf_counter()
+    try:
+        text = await _complete(model, prompt, schema)
+    except Exception:
+        metrics.LLM_ERRORS.inc(model=model_name)
+        raise
+    elapsed = time.perf_counter() - started
+    prompt_tokens, completion_tokens = await asyncio.to_thread(
+        lambda: (count_tokens(prompt, model_name), count_tokens(text, model_name))
+    )
+    metrics.observe_llm(model_name, elapsed, prompt_tokens, completion_tokens)
+    return text
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize line endings and trailing whitespace, which never change the answer."""
+    lines = prompt.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+class ResponseCacheBackend(ABC):
+    """Shared second-tier storage for cached responses."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        ...
+
+
+class RedisResponseBackend(ResponseCacheBackend):
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self._redis = LoopLocalRedis(url, decode_responses=True)
+
+    @property
+    def client(self) -> aioredis.Redis:
+        return self._redis.get()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(f"llmcache:{key}")
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await self.client.set(f"llmcache:{key}", value, ex=ttl if ttl > 0 else None)
+
+
+class SQLiteResponseBackend(ResponseCacheBackend):
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _get(self, key: str) -> Optional[str]:
+        # The connection's own context manager only commits; closing() closes it
+        with self._lock, closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at and expires_at < time.time():
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            return value
+
+    def _set(self, key: str, value: str, ttl: int) -> None:
+        expires_at = time.time() + ttl if ttl > 0 else None
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at))
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+
+class ResponseCache:
+    def __init__(self, ttl: int = 86400, max_items: int = 1024, backend: Optional[ResponseCacheBackend] = None) -> None:
+        self.ttl = ttl
+        self.max_items = max_items
+        self.backend = backend
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "saved_tokens": 0}
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, params: Optional[Dict[str, Any]] = None) -> str:
+        payload = json.dumps([model_name, normalize_prompt(prompt), params or {}], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at >= time.monotonic():
+                self._memory.move_to_end(key)
+                return value
+            del self._memory[key]
+        if self.backend is not None:
+            value = await self.backend.get(key)
+            if value is not None:
+                self._remember(key, value)
+                return value
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        self._remember(key, value)
+        if self.backend is not None:
+            await self.backend.set(key, value, self.ttl)
+
+    def _remember(self, key: str, value: str) -> None:
+        if self.max_items <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else float("inf")
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    async def generate(self, model: Any, model_name: str, prompt: str, schema: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Return the cached completion for this request, or call the model and
+        cache its result.
+        """
+        key = self.make_key(model_name, prompt, _params(model, schema))
+        cached = await self.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            self.stats["saved_tokens"] += count_tokens(prompt, model_name) + count_tokens(cached, model_name)
+            return cached
+        self.stats["misses"] += 1
+
+        async def fill() -> str:
+            text = await _call_provider(model, model_name, prompt, schema)
+            await self.set(key, text)
+            return text
+
+        # Identical requests in flight (here or, with a shared tier, elsewhere) share one call
+        lookup = (lambda: self.get(key)) if self.backend is not None else None
+        return await _llm_flight.do(key, fill, lookup=lookup)
+
+
+def _params(model: Any, schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the request parameters that are part of the cache key."""
+    params = dict(getattr(model, "sampling_params", None) or {})
+    if schema is not None:
+        params["schema"] = schema
+    return params
+
+
+def make_response_cache() -> Optional[ResponseCache]:
+    """Create the response cache configured by the environment, or None if disabled."""
+    mode = os.environ.get("LLM_CACHE", "memory")
+    if mode == "off":
+        return None
+    backend: Optional[ResponseCacheBackend] = None
+    if mode == "redis":
+        url = os.environ.get("LLM_CACHE_URL") or os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
+        backend = RedisResponseBackend(url)
+    elif mode == "sqlite":
+        default_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "cache", "llm_responses.sqlite3"))
+        backend = SQLiteResponseBackend(os.environ.get("LLM_CACHE_PATH", default_path))
+    elif mode != "memory":
+        raise ValueError(f"Unknown LLM cache mode '{mode}'")
+    return ResponseCache(
+        ttl=int(os.environ.get("LLM_CACHE_TTL", "86400")),
+        max_items=int(os.environ.get("LLM_CACHE_MAX_ITEMS", "1024")),
+        backend=backend,
+    )
+
+
+response_cache = make_response_cache()
+if response_cache is not None:
+    metrics.register_cache("llm_response", lambda: (response_cache.stats["hits"], response_cache.stats["misses"]))
+
+
+async def generate(
+    model: Any, model_name: str, prompt: str, use_cache: bool = True, schema: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Complete `prompt`, through the response cache when it is enabled and
+    `use_cache` is true.  With `schema`, ask for a JSON reply matching it.
+    Concurrent identical requests share one provider call either way.
+    """
+    if use_cache and response_cache is not None:
+        return await response_cache.generate(model, model_name, prompt, schema)
+    key = ResponseCache.make_key(model_name, prompt, _params(model, schema))
+    return await _llm_flight.do(key, lambda: _call_provider(model, model_name, prompt, schema))
@@ -0,0 +1,256 @@
+"""
+Latency-aware routing across model providers.
+
+A route maps a logical model name to several provider targets, configured as
+JSON in `LLM_ROUTES`, e.g.
+
+    {"gpt-3.5-turbo": ["gpt-3.5-turbo", "azure/gpt-35-turbo", "local/llama3"]}
+
+Each target keeps a rolling window of its latencies and failures.  Requests go
+to the healthy target with the lowest median latency (targets without samples
+are tried first so every target gets measured) and fail over to the next one
+on errors.  A target is unhealthy while its error rate exceeds
+`LLM_ROUTER_MAX_ERROR_RATE`, until `LLM_ROUTER_COOLDOWN` seconds pass without
+a new failure.
+
+Hedged routes send a duplicate request to the runner-up target when the first
+one has not answered (or, when streaming, produced a token) within its
+`LLM_HEDGE_PERCENTILE` latency, and cancel whichever request loses.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+ROUTER_WINDOW = int(os.environ.get("LLM_ROUTER_WINDOW", "100"))
+MAX_ERROR_RATE = float(os.environ.get("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+COOLDOWN = float(os.environ.get("LLM_ROUTER_COOLDOWN", "30"))
+HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+# Hedge delay used until a target has latency samples
+HEDGE_DEFAULT_DELAY = float(os.environ.get("LLM_HEDGE_DELAY", "2"))
+
+
+def load_routes() -> Dict[str, List[str]]:
+    raw = os.environ.get("LLM_ROUTES", "").strip()
+    if not raw:
+        return {}
+    routes = json.loads(raw)
+    return {name: list(targets) for name, targets in routes.items()}
+
+
+class LatencyStats:
+    """Rolling latency and error window of one provider target."""
+
+    def __init__(self, window: int = ROUTER_WINDOW) -> None:
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self.last_error = 0.0
+
+    def record(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self._outcomes.append(True)
+
+    def record_error(self) -> None:
+        self._outcomes.append(False)
+        self.last_error = time.monotonic()
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    @property
+    def healthy(self) -> bool:
+        return self.error_rate <= MAX_ERROR_RATE or time.monotonic() - self.last_error > COOLDOWN
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "error_rate": self.error_rate,
+            "samples": len(self._outcomes),
+            "healthy": self.healthy,
+        }
+
+
+_stats: Dict[str, LatencyStats] = {}
+
+
+def target_stats(target: str) -> LatencyStats:
+    stats = _stats.get(target)
+    if stats is None:
+        stats = _stats.setdefault(target, LatencyStats())
+    return stats
+
+
+def route_stats() -> Dict[str, Dict[str, Any]]:
+    """Latency and health snapshot of every target seen by this process."""
+    return {target: stats.snapshot() for target, stats in _stats.items()}
+
+
+async def _close(iterator: AsyncIterator[str]) -> None:
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+async def _cancel(task: "asyncio.Task[Any]") -> None:
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+
+class RoutedProvider:
+    """Provider that dispatches each request to one of several targets."""
+
+    def __init__(self, name: str, targets: List[Tuple[str, Any]], hedge: bool = False) -> None:
+        if not targets:
+            raise ValueError(f"Route '{name}' has no targets")
+        self.name = name
+        self.targets = targets
+        self.hedge = hedge
+
+    def ranked(self) -> List[Tuple[str, Any]]:
+        """Targets in the order they should be tried."""
+
+        def key(target: Tuple[str, Any]) -> Tuple[bool, float]:
+            stats = target_stats(target[0])
+            p50 = stats.percentile(50)
+            return (not stats.healthy, p50 if p50 is not None else 0.0)
+
+        return sorted(self.targets, key=key)
+
+    def _hedge_delay(self, target: str) -> float:
+        delay = target_stats(target).percentile(HEDGE_PERCENTILE)
+        return delay if delay is not None else HEDGE_DEFAULT_DELAY
+
+    async def _timed(self, target: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        stats = target_stats(target)
+        started = time.monotonic()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            stats.record_error()
+            raise
+        stats.record(time.monotonic() - started)
+        return result
+
+    async def generate(self, prompt: str) -> str:
+        ranked = self.ranked()
+        error: Optional[Exception] = None
+        if self.hedge and len(ranked) > 1:
+            try:
+                return await self._hedged_generate(prompt, ranked)
+            except Exception as exc:
+                error, ranked = exc, ranked[2:]
+        for target, provider in ranked:
+            try:
+                return await self._timed(target, lambda: provider.generate(prompt))
+            except Exception as exc:
+                error = exc
+        assert error is not None
+        raise error
+
+    async def _hedged_generate(self, prompt: str, ranked: List[Tuple[str, Any]]) -> str:
+        (first, first_provider), (second, second_provider) = ranked[0], ranked[1]
+        tasks = {asyncio.create_task(self._timed(first, lambda: first_provider.generate(prompt)))}
+        done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay(first))
+        if not done or next(iter(done)).exception() is not None:
+            tasks.add(asyncio.create_task(self._timed(second, lambda: second_provider.generate(prompt))))
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # Both failed: surface the last error
+            raise next(iter(done)).exception()  # type: ignore[misc]
+        finally:
+            for task in tasks:
+                await _cancel(task)
+
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        return self._stream(lambda provider: provider.stream(prompt))
+
+    def stream_structured(self, prompt: str, schema: Dict[str, Any]) -> AsyncIterator[str]:
+        return self._stream(lambda provider: provider.stream_structured(prompt, schema))
+
+    async def _stream(self, open_stream: Callable[[Any], AsyncIterator[str]]) -> AsyncIterator[str]:
+        ranked = self.ranked()
+        iterator, first = await self._open(open_stream, ranked)
+        try:
+            if first:
+                yield first
+            async for delta in iterator:
+                yield delta
+        finally:
+            await _close(iterator)
+
+    async def _first_token(self, target: str, iterator: AsyncIterator[str]) -> str:
+        async def first() -> str:
+            try:
+                return await iterator.__anext__()
+            except StopAsyncIteration:
+                return ""
+
+        return await self._timed(target, first)
+
+    async def _open(
+        self, open_stream: Callable[[Any], AsyncIterator[str]], ranked: List[Tuple[str, Any]]
+    ) -> Tuple[AsyncIterator[str], str]:
+        """
+        Start streaming and wait for the first token, failing over (and
+        hedging, if enabled) on the time to first token.  Returns the winning
+        iterator and its first token; losing streams are closed.
+        """
+        pending = list(ranked)
+        running: Dict["asyncio.Task[str]", AsyncIterator[str]] = {}
+        error: Optional[BaseException] = None
+
+        def start() -> Optional[float]:
+            target, provider = pending.pop(0)
+            iterator = open_stream(provider)
+            running[asyncio.create_task(self._first_token(target, iterator))] = iterator
+            return self._hedge_delay(target)
+
+        try:
+            timeout = start()
+            while running:
+                hedge_now = self.hedge and bool(pending)
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout if hedge_now else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    timeout = start()
+                    continue
+                for task in done:
+                    iterator = running.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        return iterator, task.result()
+                    await _close(iterator)
+                    error = exc
+                if not running and pending:
+                    timeout = start()
+            assert error is not None
+            raise error
+        finally:
+            for task, iterator in running.items():
+                await _cancel(task)
+                await _close(iterator)
@@ -0,0 +1,53 @@
+"""
+Token counting and context window sizes.  Counts use the model's `tiktoken`
+encoding when available and fall back to a four-characters-per-token estimate,
+which is close enough for budgeting English text.
+"""
+import functools
+import logging
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Context window (prompt + completion tokens) by model name prefix; the longest
+# matching prefix wins
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4o": 128000,
+    "claude": 200000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model_name: str) -> Optional[Any]:
+    try:
+        import tiktoken  # type: ignore
+
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as exc:  # not installed, or encoding files unavailable offline
+        logger.info("tiktoken unavailable, estimating token counts: %s", exc)
+        return None
+
+
+def count_tokens(text: str, model_name: str = "gpt-3.5-turbo") -> int:
+    if not text:
+        return 0
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def context_window(model_name: str) -> int:
+    matches = [prefix for prefix in CONTEXT_WINDOWS if model_name.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return CONTEXT_WINDOWS[max(matches, key=len)]
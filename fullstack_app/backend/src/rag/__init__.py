@@ -1 +1,48 @@
-"""Generic RAG utilities."""
\ No newline at end of file
+"""
+Generic RAG utilities.  `get_agent_index` returns the persistent retrieval
+index over an agent's `rag/` knowledge folder, refreshed incrementally when its
+files change; `VectorIndex.from_texts` indexes transient text such as uploads.
+Retrieval can be disabled with `RAG_ENABLED=0`, in which case agents fall back
+to passing whole documents.
+"""
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .chunking import chunk_text  # noqa: F401
+from .embeddings import Embedder, HashingEmbedder, make_embedder  # noqa: F401
+from .index import VectorIndex
+
+RAG_ENABLED = os.environ.get("RAG_ENABLED", "1") != "0"
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", "4"))
+# Documents shorter than this are passed whole instead of being retrieved from
+RAG_MIN_CONTEXT_CHARS = int(os.environ.get("RAG_MIN_CONTEXT_CHARS", "3200"))
+INDEX_DIR = os.environ.get(
+    "RAG_INDEX_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "cache", "rag")),
+)
+
+_embedder: Optional[Embedder] = None
+_indexes: Dict[str, VectorIndex] = {}
+
+
+def get_embedder() -> Embedder:
+    global _embedder
+    if _embedder is None:
+        _embedder = make_embedder()
+    return _embedder
+
+
+def get_agent_index(agent_name: str, rag_path: Path) -> VectorIndex:
+    """Return the knowledge index of an agent, refreshed against its RAG folder."""
+    index = _indexes.get(agent_name)
+    if index is None:
+        index = VectorIndex(get_embedder(), os.path.join(INDEX_DIR, agent_name))
+        _indexes[agent_name] = index
+    index.refresh(rag_path)
+    return index
+
+
+def format_chunks(chunks: List[Dict[str, str]]) -> str:
+    """Join retrieved chunks into prompt text."""
+    return "\n\n".join(chunk["text"] for chunk in chunks)
@@ -0,0 +1,122 @@
+"""
+Vector index over text chunks.  Vectors are kept in a NumPy array; a persistent
+index stores them in `vectors.npy` (opened memory-mapped, so many worker
+processes share the same pages) next to a `chunks.json` manifest recording
+each chunk's text and source file.
+
+`refresh` makes a persistent index match a folder incrementally: chunks of
+files whose size and mtime are unchanged keep their vectors, and only new or
+modified files are re-chunked and embedded.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .chunking import chunk_text
+from .embeddings import Embedder
+
+# Knowledge files indexed from an agent's RAG folder; JSON files are
+# configuration (sections, formatting), not knowledge
+INDEXED_SUFFIXES = (".md", ".txt")
+
+
+class VectorIndex:
+    def __init__(self, embedder: Embedder, directory: Optional[str] = None) -> None:
+        self.embedder = embedder
+        self.directory = directory
+        self.chunks: List[Dict[str, Any]] = []
+        self.sources: Dict[str, Tuple[int, int]] = {}
+        self.vectors: np.ndarray = np.zeros((0, embedder.dim), dtype=np.float32)
+        self._lock = threading.Lock()
+        if directory:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @classmethod
+    def from_texts(cls, embedder: Embedder, texts: Iterable[Tuple[str, str]], chunk_size: int = 800) -> "VectorIndex":
+        """Build an in-memory index from (source, text) pairs, e.g. uploaded documents."""
+        index = cls(embedder)
+        chunks = [{"source": source, "text": chunk} for source, text in texts for chunk in chunk_text(text, chunk_size)]
+        if chunks:
+            index.chunks = chunks
+            index.vectors = embedder.embed([c["text"] for c in chunks])
+        return index
+
+    def _paths(self) -> Tuple[str, str]:
+        assert self.directory is not None
+        return os.path.join(self.directory, "vectors.npy"), os.path.join(self.directory, "chunks.json")
+
+    def _load(self) -> None:
+        vectors_path, manifest_path = self._paths()
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            vectors = np.load(vectors_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return
+        if manifest.get("embedder") != self.embedder.name or vectors.shape != (len(manifest["chunks"]), self.embedder.dim):
+            # Built with another embedder or inconsistent; rebuild on refresh
+            return
+        self.chunks = manifest["chunks"]
+        self.sources = {k: (v[0], v[1]) for k, v in manifest["sources"].items()}
+        self.vectors = vectors
+
+    def _save(self) -> None:
+        vectors_path, manifest_path = self._paths()
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_vectors = f"{vectors_path}.{os.getpid()}.tmp.npy"
+        tmp_manifest = f"{manifest_path}.{os.getpid()}.tmp"
+        np.save(tmp_vectors, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump({"embedder": self.embedder.name, "sources": self.sources, "chunks": self.chunks}, f)
+        os.replace(tmp_vectors, vectors_path)
+        os.replace(tmp_manifest, manifest_path)
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+
+    def refresh(self, root: Path, suffixes: Tuple[str, ...] = INDEXED_SUFFIXES) -> bool:
+        """
+        Bring the index in line with the files under `root`.  Returns True if
+        anything was re-embedded or removed.
+        """
+        current: Dict[str, Tuple[int, int]] = {}
+        if root.is_dir():
+            for path in sorted(root.rglob("*")):
+                if path.is_file() and path.suffix.lower() in suffixes:
+                    st = path.stat()
+                    current[path.relative_to(root).as_posix()] = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if current == self.sources:
+                return False
+            keep_rows = [i for i, c in enumerate(self.chunks) if self.sources.get(c["source"]) == current.get(c["source"])]
+            chunks = [self.chunks[i] for i in keep_rows]
+            parts = [np.asarray(self.vectors[keep_rows], dtype=np.float32)] if keep_rows else []
+            changed = [source for source, stamp in current.items() if self.sources.get(source) != stamp]
+            new_chunks = []
+            for source in changed:
+                text = (root / source).read_text(encoding="utf-8", errors="ignore")
+                new_chunks.extend({"source": source, "text": chunk} for chunk in chunk_text(text))
+            if new_chunks:
+                parts.append(self.embedder.embed([c["text"] for c in new_chunks]))
+            self.chunks = chunks + new_chunks
+            self.vectors = np.concatenate(parts) if parts else np.zeros((0, self.embedder.dim), dtype=np.float32)
+            self.sources = current
+            if self.directory:
+                self._save()
+            return True
+
+    def search(self, query: str, k: int = 4) -> List[Dict[str, Any]]:
+        """Return up to `k` chunks most similar to `query`, best first, with a `score`."""
+        if not self.chunks or k <= 0:
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        scores = np.asarray(self.vectors @ query_vector)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{**self.chunks[i], "score": float(scores[i])} for i in top]
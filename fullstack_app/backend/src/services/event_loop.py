@@ -0,0 +1,74 @@
+"""
+Long-lived asyncio event loop for Celery worker processes.  Celery tasks are
+synchronous, so instead of calling `asyncio.run` (which creates and tears down
+a loop, and with it every pooled HTTP or Redis connection) each worker process
+runs one event loop in a background thread and tasks submit their coroutines
+to it.
+
+With the prefork pool each child process gets its own loop.  With the threads
+pool (`celery worker --pool threads --concurrency N`) all task threads share
+the process loop, so up to N I/O-bound agent jobs run concurrently in a single
+process.
+"""
+import asyncio
+import os
+import threading
+from typing import Any, Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class WorkerLoop:
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # A forked child inherits the object but not the loop thread
+            if self._loop is None or self._pid != os.getpid() or not self._loop.is_running():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run() -> None:
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name="worker-event-loop", daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+                self._pid = os.getpid()
+            return self._loop
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """Run `coro` on the worker loop and block the calling thread until it finishes."""
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stop(self, shutdown: Optional[Coroutine[Any, Any, Any]] = None) -> None:
+        """Run an optional `shutdown` coroutine, then stop the loop."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or self._pid != os.getpid():
+                if shutdown is not None:
+                    shutdown.close()
+                return
+            self._loop = self._thread = None
+        if shutdown is not None:
+            asyncio.run_coroutine_threadsafe(shutdown, loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=10)
+        loop.close()
+
+
+worker_loop = WorkerLoop()
@@ -1,12 +1,49 @@
 """
-Simple in-memory job manager to track asynchronous tasks.  Each job is represented by a
+Job manager to track asynchronous tasks.  Each job is represented by a
 dictionary with an ID, status, logs, and result.  This module is designed to work
-alongside Celery tasks or FastAPI background tasks.  In production, consider persisting
-jobs in a database or using a proper result backend.
+alongside Celery tasks or FastAPI background tasks.
+
+Job state lives in a pluggable `JobStore`.  The default `RedisJobStore` shares
+jobs between the API processes and the Celery workers; `InMemoryJobStore` keeps
+jobs in a per-process dict and is intended for tests and single-process
+development.  The backend is selected with the `JOB_STORE` environment variable
+(`redis` or `memory`).
+
+Clients follow a job with `JobManager.subscribe`, which yields only the log
+lines and status changes that happened after a given log position and is woken
+by store notifications rather than polling.  Once a job reaches a final status
+(completed, failed or cancelled) further updates are ignored, so a cancelled
+job cannot be revived by a task that is still winding down.
+
+Memory is bounded in both stores: each job keeps only its last `JOB_LOG_LIMIT`
+log lines (positions stay absolute, so clients resuming from an old position
+simply skip the dropped lines), finished jobs expire after `JOB_TTL_SECONDS`
+and queued or running jobs not updated for `JOB_ACTIVE_TTL_SECONDS` (e.g.
+orphaned by a worker crash) expire too.  The in-memory store also keeps at
+most `JOB_MAX_FINISHED` finished jobs and writes results larger than
+`JOB_RESULT_SPILL_BYTES` to `JOB_RESULT_DIR` instead of holding them.
 """
 import asyncio
+import json
+import os
+import threading
+import time
 import uuid
-from typing import Any, Dict, Optional
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from itertools import islice
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+import redis.asyncio as aioredis
+
+from .redis_client import LoopLocalRedis
+
+JOB_LOG_LIMIT = int(os.environ.get("JOB_LOG_LIMIT", "1000"))
+JOB_ACTIVE_TTL = int(os.environ.get("JOB_ACTIVE_TTL_SECONDS", str(2 * 86400)))
+JOB_MAX_FINISHED = int(os.environ.get("JOB_MAX_FINISHED", "1000"))
+JOB_RESULT_SPILL_BYTES = int(os.environ.get("JOB_RESULT_SPILL_BYTES", str(256 * 1024)))
+_DEFAULT_RESULT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "cache", "job_results"))
 
 
 class JobStatus:
@@ -14,41 +51,652 @@ class JobStatus:
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
+    FINAL = (COMPLETED, FAILED, CANCELLED)
+
+
+class _Broadcaster:
+    """
+    Fans job notifications out to the local subscribers of each job.  A
+    notification is a dict with `status`, `log` and `index` (the 1-based
+    position of `log` in the job's log list).
+    """
 
-class JobManager:
     def __init__(self) -> None:
-        self._jobs: Dict[str, Dict[str, Any]] = {}
-        self._lock = asyncio.Lock()
+        self._queues: Dict[str, Set["asyncio.Queue[Dict[str, Any]]"]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._queues)
+
+    def publish(self, job_id: str, notification: Dict[str, Any]) -> None:
+        for queue in self._queues.get(job_id, ()):
+            queue.put_nowait(notification)
+
+    @asynccontextmanager
+    async def listen(self, job_id: str) -> AsyncIterator["asyncio.Queue[Dict[str, Any]]"]:
+        queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self._queues.setdefault(job_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._queues.get(job_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._queues[job_id]
+
+
+class JobStore(ABC):
+    """
+    Storage backend for job records.  Implementations must apply each update
+    atomically so concurrent writers never lose log lines or status changes,
+    and must deliver a notification for every update to `listen` subscribers.
+    """
+
+    @abstractmethod
+    async def create(self, job: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def update(
+        self, job_id: str, status: str, log: Optional[str] = None, result: Any = None, fields: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Apply an update, setting the JSON metadata `fields` given; return
+        False if the job does not exist or is already final.
+        """
+        ...
+
+    @abstractmethod
+    async def get(self, job_id: str, logs_from: Optional[int] = 0) -> Optional[Dict[str, Any]]:
+        """
+        Return a snapshot of the job, or None if unknown or expired.  Only log
+        lines from position `logs_from` onwards are included; None skips the
+        logs entirely.  `logs_start` is the position of the first returned
+        line, which is later than `logs_from` if older lines were dropped.
+        """
+        ...
+
+    @abstractmethod
+    async def increment(self, job_id: str, field: str, amount: int = 1) -> int:
+        """Atomically add `amount` to an integer field and return the new value."""
+        ...
+
+    @abstractmethod
+    def listen(self, job_id: str) -> Any:
+        """
+        Async context manager yielding an `asyncio.Queue` that receives a
+        notification for every subsequent update of the job.
+        """
+        ...
+
+
+class JobRecord:
+    """
+    In-memory job state.  `fields` holds the JSON metadata and is replaced,
+    never mutated, on update, so snapshots can share it without copying.  The
+    result is kept JSON-encoded, so every snapshot decodes its own copy.
+    """
+
+    __slots__ = ("fields", "logs", "logs_total", "result_json", "result_path", "finished_at")
+
+    def __init__(self, fields: Dict[str, Any], log_limit: int) -> None:
+        self.fields = fields
+        self.logs: Deque[str] = deque(maxlen=log_limit if log_limit > 0 else None)
+        self.logs_total = 0
+        self.result_json: Optional[str] = None
+        self.result_path: Optional[str] = None
+        self.finished_at: Optional[float] = None
+
+
+class InMemoryJobStore(JobStore):
+    def __init__(
+        self,
+        ttl: int = 86400,
+        max_finished: int = JOB_MAX_FINISHED,
+        log_limit: int = JOB_LOG_LIMIT,
+        spill_bytes: int = JOB_RESULT_SPILL_BYTES,
+        result_dir: Optional[str] = None,
+        active_ttl: int = JOB_ACTIVE_TTL,
+    ) -> None:
+        self.ttl = ttl
+        self.active_ttl = active_ttl
+        self.max_finished = max_finished
+        self.log_limit = log_limit
+        self.spill_bytes = spill_bytes
+        self.result_dir = result_dir or os.environ.get("JOB_RESULT_DIR", _DEFAULT_RESULT_DIR)
+        self._jobs: Dict[str, JobRecord] = {}
+        # Finished job IDs, oldest first
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+        # Queued and running job IDs, least recently updated first
+        self._active: "OrderedDict[str, float]" = OrderedDict()
+        # Short critical sections only; jobs may be touched from several loops
+        self._lock = threading.Lock()
+        self._broadcaster = _Broadcaster()
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        fields = {k: v for k, v in job.items() if k not in ("logs", "result")}
+        with self._lock:
+            self._jobs[job["id"]] = JobRecord(fields, self.log_limit)
+            self._active[job["id"]] = time.time()
+            evicted = self._evict()
+        await self._remove_spilled(evicted)
+
+    async def update(
+        self, job_id: str, status: str, log: Optional[str] = None, result: Any = None, fields: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        encoded = json.dumps(result) if result is not None else None
+        spilled = await self._spill(job_id, encoded) if encoded is not None else None
+        with self._lock:
+            record = self._jobs.get(job_id)
+            applied = record is not None and record.fields["status"] not in JobStatus.FINAL
+            if applied:
+                orphaned = self._apply(job_id, record, status, log, encoded, spilled, fields)  # type: ignore[arg-type]
+            else:
+                orphaned = [spilled] if spilled else []
+        await self._remove_spilled(orphaned)
+        return applied
+
+    def _apply(
+        self,
+        job_id: str,
+        record: JobRecord,
+        status: str,
+        log: Optional[str],
+        encoded: Optional[str],
+        spilled: Optional[str],
+        fields: Optional[Dict[str, Any]],
+    ) -> List[str]:
+        """Apply an update under the lock; return result files that are no longer referenced."""
+        record.fields = {**record.fields, **(fields or {}), "status": status}
+        if log:
+            record.logs.append(log)
+            record.logs_total += 1
+        replaced = None
+        if encoded is not None:
+            replaced = record.result_path
+            record.result_json, record.result_path = (None, spilled) if spilled else (encoded, None)
+        if status in JobStatus.FINAL:
+            record.finished_at = time.time()
+            self._active.pop(job_id, None)
+            self._finished[job_id] = record.finished_at
+            self._finished.move_to_end(job_id)
+        else:
+            self._active[job_id] = time.time()
+            self._active.move_to_end(job_id)
+        evicted = self._evict()
+        self._broadcaster.publish(job_id, {"status": status, "log": log or "", "index": record.logs_total})
+        return evicted + ([replaced] if replaced and replaced != spilled else [])
+
+    async def get(self, job_id: str, logs_from: Optional[int] = 0) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None or self._expired(job_id, record):
+                return None
+            logs: List[str] = []
+            start = record.logs_total
+            if logs_from is not None:
+                first = record.logs_total - len(record.logs)
+                start = max(logs_from, first)
+                logs = list(islice(record.logs, start - first, None))
+            job = {**record.fields, "logs": logs, "logs_start": start, "result": None}
+            result_json, result_path = record.result_json, record.result_path
+        if result_json is not None:
+            job["result"] = json.loads(result_json)
+        elif result_path is not None:
+            job["result"] = await asyncio.to_thread(self._load_result, result_path)
+        return job
+
+    async def increment(self, job_id: str, field: str, amount: int = 1) -> int:
+        with self._lock:
+            record = self._jobs[job_id]
+            value = record.fields.get(field, 0) + amount
+            record.fields = {**record.fields, field: value}
+            return value
+
+    def listen(self, job_id: str) -> Any:
+        return self._broadcaster.listen(job_id)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def _expired(self, job_id: str, record: JobRecord) -> bool:
+        now = time.time()
+        if record.finished_at is None:
+            updated_at = self._active.get(job_id, now)
+            return self.active_ttl > 0 and now - updated_at > self.active_ttl
+        return self.ttl > 0 and now - record.finished_at > self.ttl
+
+    def _evict(self) -> List[str]:
+        """
+        Drop expired and surplus finished jobs and abandoned active ones;
+        return their spilled result files.
+        """
+        spilled: List[str] = []
+        now = time.time()
+        while self._active and self.active_ttl > 0:
+            job_id, updated_at = next(iter(self._active.items()))
+            if now - updated_at <= self.active_ttl:
+                break
+            del self._active[job_id]
+            record = self._jobs.pop(job_id, None)
+            if record is not None and record.result_path:
+                spilled.append(record.result_path)
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            over_count = self.max_finished > 0 and len(self._finished) > self.max_finished
+            if not over_count and not (self.ttl > 0 and now - finished_at > self.ttl):
+                break
+            del self._finished[job_id]
+            record = self._jobs.pop(job_id, None)
+            if record is not None and record.result_path:
+                spilled.append(record.result_path)
+        return spilled
+
+    async def _spill(self, job_id: str, data: str) -> Optional[str]:
+        """Write a large JSON-encoded result to disk and return its path, or None to keep it in memory."""
+        if self.spill_bytes <= 0 or len(data) <= self.spill_bytes:
+            return None
+        path = os.path.join(self.result_dir, f"{job_id}-{uuid.uuid4().hex[:8]}.json")
 
-    async def create_job(self, job_type: str, description: str = "") -> str:
+        def write() -> None:
+            os.makedirs(self.result_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(data)
+
+        await asyncio.to_thread(write)
+        return path
+
+    @staticmethod
+    def _load_result(path: str) -> Any:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except OSError:
+            # Evicted concurrently
+            return None
+
+    @staticmethod
+    async def _remove_spilled(paths: List[str]) -> None:
+        for path in paths:
+            try:
+                await asyncio.to_thread(os.remove, path)
+            except OSError:
+                pass
+
+
+# Atomically apply a status/log/result update, reset the job's expiry and
+# publish a notification.  `logs_total` counts every line ever logged; the
+# list only keeps the newest ones.  KEYS: job hash, log list.  ARGV: status,
+# log, result JSON, has-result flag, TTL (0 = none), notification channel, log
+# limit (0 = none), comma-separated final statuses, JSON object of encoded
+# fields to set.
+_UPDATE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'status')
+if not current or string.find(',' .. ARGV[8] .. ',', ',' .. current .. ',', 1, true) then
+  return 0
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[1])
+for field, value in pairs(cjson.decode(ARGV[9])) do
+  redis.call('HSET', KEYS[1], field, value)
+end
+local index = tonumber(redis.call('HGET', KEYS[1], 'logs_total') or redis.call('LLEN', KEYS[2]))
+if ARGV[2] ~= '' then
+  redis.call('RPUSH', KEYS[2], ARGV[2])
+  index = index + 1
+  redis.call('HSET', KEYS[1], 'logs_total', index)
+  local limit = tonumber(ARGV[7])
+  if limit > 0 then
+    redis.call('LTRIM', KEYS[2], -limit, -1)
+  end
+end
+if ARGV[4] == '1' then
+  redis.call('HSET', KEYS[1], 'result', ARGV[3])
+end
+local ttl = tonumber(ARGV[5])
+if ttl > 0 then
+  redis.call('EXPIRE', KEYS[1], ttl)
+  redis.call('EXPIRE', KEYS[2], ttl)
+else
+  redis.call('PERSIST', KEYS[1])
+  redis.call('PERSIST', KEYS[2])
+end
+redis.call('PUBLISH', ARGV[6], cjson.encode({status = ARGV[1], log = ARGV[2], index = index}))
+return 1
+"""
+
+# Read a job with the log lines from an absolute position.  KEYS: job hash, log
+# list.  ARGV: first position (-1 = no logs).  Returns {fields, start, lines}.
+_GET_SCRIPT = """
+local data = redis.call('HGETALL', KEYS[1])
+if #data == 0 then
+  return {}
+end
+local from = tonumber(ARGV[1])
+if from < 0 then
+  return {data, -1, {}}
+end
+local length = redis.call('LLEN', KEYS[2])
+local total = tonumber(redis.call('HGET', KEYS[1], 'logs_total') or length)
+local first = total - length
+local start = math.max(from, first)
+return {data, start, redis.call('LRANGE', KEYS[2], start - first, -1)}
+"""
+
+
+class RedisJobStore(JobStore):
+    """
+    Redis-backed job store.  Each job is a hash (`job:{id}`) holding its
+    status and JSON-encoded metadata fields, plus an append-only list
+    (`job:{id}:logs`).  Finished
+    jobs expire after `ttl` seconds, queued and running ones `active_ttl`
+    seconds after their last update.  Every update is published on the
+    `job:{id}:events` channel; each process holds a single pattern
+    subscription and fans notifications out to its local listeners.
+
+    A client may be injected (e.g. `fakeredis.aioredis.FakeRedis` in tests);
+    otherwise one is created per event loop (see `LoopLocalRedis`), since
+    asyncio Redis connections cannot be shared between loops.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        ttl: int = 86400,
+        client: Optional[aioredis.Redis] = None,
+        log_limit: int = JOB_LOG_LIMIT,
+        active_ttl: int = JOB_ACTIVE_TTL,
+    ) -> None:
+        self.url = url or "redis://localhost:6379/0"
+        self.ttl = ttl
+        self.active_ttl = active_ttl
+        self.log_limit = log_limit
+        self._client = client
+        self._redis = LoopLocalRedis(self.url, decode_responses=True)
+        self._broadcaster = _Broadcaster()
+        self._dispatcher: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def client(self) -> aioredis.Redis:
+        if self._client is not None:
+            return self._client
+        return self._redis.get()
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    @staticmethod
+    def _logs_key(job_id: str) -> str:
+        return f"job:{job_id}:logs"
+
+    @staticmethod
+    def channel(job_id: str) -> str:
+        return f"job:{job_id}:events"
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        # The status is stored raw so the update script can set it directly
+        mapping = {
+            field: value if field == "status" else json.dumps(value)
+            for field, value in job.items()
+            if field != "logs"
+        }
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key(job["id"]), mapping=mapping)
+            if self.active_ttl > 0:
+                pipe.expire(self._key(job["id"]), self.active_ttl)
+            await pipe.execute()
+
+    async def update(
+        self, job_id: str, status: str, log: Optional[str] = None, result: Any = None, fields: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        ttl = self.ttl if status in JobStatus.FINAL else self.active_ttl
+        updated = await self.client.eval(
+            _UPDATE_SCRIPT,
+            2,
+            self._key(job_id),
+            self._logs_key(job_id),
+            status,
+            log or "",
+            json.dumps(result) if result is not None else "",
+            "1" if result is not None else "0",
+            ttl,
+            self.channel(job_id),
+            self.log_limit,
+            ",".join(JobStatus.FINAL),
+            json.dumps({field: json.dumps(value) for field, value in (fields or {}).items()}),
+        )
+        return bool(updated)
+
+    async def get(self, job_id: str, logs_from: Optional[int] = 0) -> Optional[Dict[str, Any]]:
+        reply = await self.client.eval(
+            _GET_SCRIPT, 2, self._key(job_id), self._logs_key(job_id), -1 if logs_from is None else logs_from
+        )
+        if not reply:
+            return None
+        data, start, lines = reply
+        fields = dict(zip(data[::2], data[1::2]))
+        job = {field: value if field == "status" else json.loads(value) for field, value in fields.items()}
+        total = job.pop("logs_total", 0)
+        job["logs"] = lines
+        job["logs_start"] = start if start >= 0 else total
+        return job
+
+    async def increment(self, job_id: str, field: str, amount: int = 1) -> int:
+        return await self.client.hincrby(self._key(job_id), field, amount)
+
+    @asynccontextmanager
+    async def listen(self, job_id: str) -> AsyncIterator["asyncio.Queue[Dict[str, Any]]"]:
+        if self._dispatcher is None or self._dispatcher.done():
+            subscribed = asyncio.get_running_loop().create_future()
+            self._dispatcher = asyncio.create_task(self._dispatch(subscribed))
+            await subscribed
+        async with self._broadcaster.listen(job_id) as queue:
+            yield queue
+
+    async def _dispatch(self, subscribed: "asyncio.Future[None]") -> None:
+        pubsub = self.client.pubsub()
+        try:
+            await pubsub.psubscribe(self.channel("*"))
+            subscribed.set_result(None)
+            async for message in pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                job_id = message["channel"][len("job:"):-len(":events")]
+                self._broadcaster.publish(job_id, json.loads(message["data"]))
+        except Exception as exc:
+            if not subscribed.done():
+                subscribed.set_exception(exc)
+        finally:
+            await pubsub.aclose()
+
+
+def make_job_store() -> JobStore:
+    """Create the job store configured by the environment."""
+    backend = os.environ.get("JOB_STORE", "redis")
+    if backend == "memory":
+        return InMemoryJobStore(ttl=int(os.environ.get("JOB_TTL_SECONDS", "86400")), active_ttl=JOB_ACTIVE_TTL)
+    if backend == "redis":
+        url = os.environ.get("JOB_STORE_URL") or os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
+        return RedisJobStore(url, ttl=int(os.environ.get("JOB_TTL_SECONDS", "86400")), active_ttl=JOB_ACTIVE_TTL)
+    raise ValueError(f"Unknown job store backend '{backend}'")
+
+
+def batch_progress(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Aggregate progress of a batch parent job: counts, percentage and throughput."""
+    total = job.get("total", 0)
+    done = job.get("completed", 0) + job.get("failed", 0) + job.get("cancelled", 0)
+    elapsed = max(time.time() - job.get("created_at", time.time()), 1e-6)
+    return {
+        "total": total,
+        "completed": job.get("completed", 0),
+        "failed": job.get("failed", 0),
+        "cancelled": job.get("cancelled", 0),
+        "done": done,
+        "percent": round(100.0 * done / total, 1) if total else 100.0,
+        "elapsed": round(elapsed, 3),
+        "throughput": done / elapsed,
+    }
+
+
+class JobManager:
+    def __init__(self, store: Optional[JobStore] = None) -> None:
+        self.store = store if store is not None else make_job_store()
+
+    async def create_job(self, job_type: str, description: str = "", **fields: Any) -> str:
+        """
+        Create a queued job and return its ID.  Extra keyword arguments are
+        stored as additional JSON-serializable fields of the job record.
+        """
         job_id = str(uuid.uuid4())
-        async with self._lock:
-            self._jobs[job_id] = {
-                "id": job_id,
-                "type": job_type,
-                "description": description,
-                "status": JobStatus.QUEUED,
-                "logs": [],
-                "result": None,
-            }
+        await self.store.create({
+            **fields,
+            "id": job_id,
+            "type": job_type,
+            "description": description,
+            "status": JobStatus.QUEUED,
+            "logs": [],
+            "result": None,
+            "created_at": time.time(),
+        })
         return job_id
 
-    async def update_job(self, job_id: str, status: str, log: Optional[str] = None, result: Any = None) -> None:
-        async with self._lock:
-            job = self._jobs.get(job_id)
-            if not job:
-                return
-            job["status"] = status
-            if log:
-                job["logs"].append(log)
-            if result is not None:
-                job["result"] = result
+    async def create_batch(self, job_type: str, count: int, description: str = "") -> Tuple[str, List[str]]:
+        """
+        Create a parent job with `count` child jobs.  The parent counts its
+        finished children in its `completed` and `failed` fields.
+        """
+        child_ids = list(await asyncio.gather(*(
+            self.create_job(job_type, description=f"{description} [{i}/{count}]")
+            for i in range(1, count + 1)
+        )))
+        parent_id = await self.create_job(
+            "batch",
+            description=description,
+            agent=job_type,
+            children=child_ids,
+            total=count,
+            completed=0,
+            failed=0,
+            cancelled=0,
+        )
+        return parent_id, child_ids
+
+    async def record_child_result(self, parent_id: str, job_id: str, status: str) -> None:
+        """Count a finished child job in its batch and log the batch progress."""
+        field = {JobStatus.COMPLETED: "completed", JobStatus.CANCELLED: "cancelled"}.get(status, "failed")
+        await self.store.increment(parent_id, field)
+        parent = await self.store.get(parent_id, logs_from=None)
+        if parent is None:
+            return
+        progress = batch_progress(parent)
+        await self.update_job(
+            parent_id,
+            JobStatus.RUNNING,
+            log=f"Job {job_id} {status} ({progress['done']}/{progress['total']}, {progress['throughput']:.2f} jobs/s)",
+        )
+
+    async def update_job(
+        self, job_id: str, status: str, log: Optional[str] = None, result: Any = None, fields: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Update a job, setting any extra `fields` of its record; return False if
+        it does not exist or has already finished.
+        """
+        return await self.store.update(job_id, status, log=log, result=result, fields=fields)
+
+    async def cancel_job(self, job_id: str) -> bool:
+        """
+        Mark a job (and, for a batch, its unfinished children) cancelled.
+        Returns False if the job does not exist or has already finished.  The
+        task running the job notices through `wait_cancelled`.
+        """
+        job = await self.store.get(job_id, logs_from=None)
+        if job is None:
+            return False
+        cancelled = await self.store.update(job_id, JobStatus.CANCELLED, log="Job cancelled")
+        if cancelled and job.get("children"):
+            await asyncio.gather(*(
+                self.store.update(child_id, JobStatus.CANCELLED, log="Batch cancelled") for child_id in job["children"]
+            ))
+        return cancelled
+
+    async def wait_cancelled(self, job_id: str, recheck: float = 5.0) -> None:
+        """
+        Return once the job is cancelled (or disappears).  Woken by store
+        notifications; the job is re-read every `recheck` seconds in case one
+        was lost.
+        """
+        async with self.store.listen(job_id) as notifications:
+            while True:
+                job = await self.store.get(job_id, logs_from=None)
+                if job is None or job["status"] == JobStatus.CANCELLED:
+                    return
+                try:
+                    note = await asyncio.wait_for(notifications.get(), timeout=recheck)
+                except asyncio.TimeoutError:
+                    continue
+                if note["status"] == JobStatus.CANCELLED:
+                    return
+
+    async def get_job(self, job_id: str, logs_from: Optional[int] = 0) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of the job; `logs_from` is passed to `JobStore.get`."""
+        job = await self.store.get(job_id, logs_from=logs_from)
+        if job is not None and "total" in job:
+            job["progress"] = batch_progress(job)
+        return job
 
-    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
-        async with self._lock:
-            return self._jobs.get(job_id)
+    async def subscribe(self, job_id: str, after: int = 0, heartbeat: float = 15.0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield the changes of a job as they happen, starting after log position
+        `after` (e.g. a client's `Last-Event-ID`).  Events are dicts with a
+        `type` of `log` (`id`, `log`), `status` (`id`, `status`) or `final`
+        (`id`, `status`, `result`); `id` is the number of log lines delivered so
+        far.  When nothing happens for `heartbeat` seconds a `heartbeat` event
+        is yielded and the job is re-read, which also recovers from a lost
+        notification.  The iterator ends after the `final` event, or
+        immediately if the job does not exist.
+        """
+        async with self.store.listen(job_id) as notifications:
+            # Read the backlog only after subscribing so no update is missed
+            job = await self.store.get(job_id, logs_from=after)
+            sent = after
+            status = None
+            while job is not None:
+                # Lines older than the log limit are gone; skip past them
+                sent = max(sent, job.get("logs_start", sent))
+                for line in job["logs"]:
+                    sent += 1
+                    yield {"type": "log", "id": sent, "log": line}
+                if job["status"] in JobStatus.FINAL:
+                    yield {"type": "final", "id": sent, "status": job["status"], "result": job["result"]}
+                    return
+                if job["status"] != status:
+                    status = job["status"]
+                    yield {"type": "status", "id": sent, "status": status}
+                job = None
+                while job is None:
+                    try:
+                        note = await asyncio.wait_for(notifications.get(), timeout=heartbeat)
+                    except asyncio.TimeoutError:
+                        yield {"type": "heartbeat", "id": sent}
+                        job = await self.store.get(job_id, logs_from=sent)
+                        if job is None:
+                            return
+                        continue
+                    if note["index"] > sent + 1 or note["status"] in JobStatus.FINAL:
+                        # Missed lines or a result to fetch: read the delta from the store
+                        job = await self.store.get(job_id, logs_from=sent)
+                        if job is None:
+                            return
+                    elif note["log"] and note["index"] == sent + 1:
+                        sent += 1
+                        yield {"type": "log", "id": sent, "log": note["log"]}
+                    if note["status"] != status and job is None:
+                        status = note["status"]
+                        yield {"type": "status", "id": sent, "status": status}
 
 
 # Instantiate a global job manager
-job_manager = JobManager()
\ No newline at end of file
+job_manager = JobManager()
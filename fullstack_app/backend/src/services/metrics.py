@@ -0,0 +1,318 @@
+"""
+Performance instrumentation.  Pipeline stages are timed with `span`, which
+records the duration in the `pipeline_stage_seconds` histogram and, inside a
+job (see `job_timings`), adds it to the job's own timings, which the task
+stores on the job record.  LLM calls, job queue wait and execution time, HTTP
+requests and cache hit ratios have their own metrics.
+
+Metrics are kept per process in a small built-in registry and rendered in the
+Prometheus text format by `render`, which the API serves on `/metrics`.
+Celery workers run in separate processes, so they serve their own metrics on
+`METRICS_PORT` when it is set (see `start_metrics_server`).  `METRICS_ENABLED=0`
+turns instrumentation off.
+"""
+import bisect
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .single_flight import single_flight_stats
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144)
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    """A named metric with a fixed set of label names."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self._samples()]
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Return the sample lines of every label set."""
+        ...
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (last one is +Inf), sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        lines: List[str] = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    """
+    Gauge or counter whose values are read from `fn` (label values -> value) at
+    render time, for statistics that other modules already keep.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        fn: Callable[[], Dict[LabelValues, float]],
+        type: str = "gauge",
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+        self.type = type
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in self.fn().items()]
+
+
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Duration of pipeline stages.", ["stage"])
+LLM_SECONDS = Histogram("llm_request_seconds", "Latency of LLM provider calls.", ["model"])
+LLM_PROMPT_TOKENS = Histogram("llm_prompt_tokens", "Prompt tokens per LLM provider call.", ["model"], TOKEN_BUCKETS)
+LLM_COMPLETION_TOKENS = Histogram(
+    "llm_completion_tokens", "Completion tokens per LLM provider call.", ["model"], TOKEN_BUCKETS
+)
+LLM_ERRORS = Counter("llm_request_errors_total", "LLM provider calls that failed.", ["model"])
+JOB_QUEUE_SECONDS = Histogram("job_queue_wait_seconds", "Time from job creation until a worker starts it.", ["agent"])
+JOB_EXECUTION_SECONDS = Histogram("job_execution_seconds", "Time a worker spent running a job.", ["agent", "status"])
+HTTP_SECONDS = Histogram("http_request_seconds", "Latency of API requests.", ["method", "route", "status"])
+
+# Cache name -> function returning (hits, misses)
+_caches: Dict[str, Callable[[], Tuple[int, int]]] = {}
+
+
+def register_cache(name: str, counts: Callable[[], Tuple[int, int]]) -> None:
+    """Report the hit and miss counts returned by `counts` as cache `name`."""
+    _caches[name] = counts
+
+
+def _cache_values(index: Optional[int]) -> Dict[LabelValues, float]:
+    values: Dict[LabelValues, float] = {}
+    for name, counts in list(_caches.items()):
+        hits, misses = counts()
+        if index is not None:
+            values[(name,)] = (hits, misses)[index]
+        elif hits + misses:
+            values[(name,)] = hits / (hits + misses)
+    return values
+
+
+def _flight_values(*fields: str) -> Dict[LabelValues, float]:
+    return {(name,): sum(stats[f] for f in fields) for name, stats in single_flight_stats().items()}
+
+
+_METRICS: List[Metric] = [
+    STAGE_SECONDS,
+    LLM_SECONDS,
+    LLM_PROMPT_TOKENS,
+    LLM_COMPLETION_TOKENS,
+    LLM_ERRORS,
+    JOB_QUEUE_SECONDS,
+    JOB_EXECUTION_SECONDS,
+    HTTP_SECONDS,
+    CallbackMetric("cache_hits_total", "Cache hits.", ["cache"], lambda: _cache_values(0), "counter"),
+    CallbackMetric("cache_misses_total", "Cache misses.", ["cache"], lambda: _cache_values(1), "counter"),
+    CallbackMetric("cache_hit_ratio", "Share of cache lookups that hit.", ["cache"], lambda: _cache_values(None)),
+    CallbackMetric(
+        "single_flight_calls_total", "Calls through single-flight groups.", ["group"], lambda: _flight_values("calls"), "counter"
+    ),
+    CallbackMetric(
+        "single_flight_coalesced_total",
+        "Calls that shared another call's result, in this or another process.",
+        ["group"],
+        lambda: _flight_values("coalesced", "remote_coalesced"),
+        "counter",
+    ),
+]
+
+
+def render() -> str:
+    """Return every metric in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class JobTimings:
+    """Cumulative stage timings and LLM token counts of one job."""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, stage: str, seconds: float) -> None:
+        entry = self.stages.setdefault(stage, {"count": 0, "seconds": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "stages": {stage: {"count": int(e["count"]), "seconds": round(e["seconds"], 3)} for stage, e in self.stages.items()},
+            "llm_tokens": {"prompt": self.prompt_tokens, "completion": self.completion_tokens},
+        }
+
+
+# Timings of the job whose task is running in the current context
+job_timings: "contextvars.ContextVar[Optional[JobTimings]]" = contextvars.ContextVar("job_timings", default=None)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time the enclosed block as pipeline stage `stage`.  Works in sync and async
+    code; stages that run concurrently within a job add up, so a job's stage
+    seconds can exceed its execution time.
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = job_timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def observe_llm(model_name: str, seconds: float, prompt_tokens: int, completion_tokens: int) -> None:
+    """Record a completed provider call."""
+    LLM_SECONDS.observe(seconds, model=model_name)
+    LLM_PROMPT_TOKENS.observe(prompt_tokens, model=model_name)
+    LLM_COMPLETION_TOKENS.observe(completion_tokens, model=model_name)
+    timings = job_timings.get()
+    if timings is not None:
+        timings.prompt_tokens += prompt_tokens
+        timings.completion_tokens += completion_tokens
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_pid: Optional[int] = None
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """
+    Serve `/metrics` on `port` from a background thread, for processes without
+    an API server such as Celery workers.  At most one server runs per
+    process.  Returns None if the port is taken.
+    """
+    global _server, _server_pid
+    # A forked child inherits the object but not the serving thread
+    if _server is not None and _server_pid == os.getpid():
+        return _server
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as exc:
+        logger.warning("Metrics server not started on port %s: %s", port, exc)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    _server, _server_pid = server, os.getpid()
+    return server
@@ -0,0 +1,21 @@
+"""
+Celery queue names and priority classes.  They are shared by the Celery app,
+which declares the queues, and the tasks that dispatch jobs to them.
+
+Agent jobs are routed to one queue per agent and priority class, named
+`agents.{agent}.{class}` (e.g. `agents.tsd.batch`).  Uploaded files are
+extracted ahead of agent runs on `EXTRACTION_QUEUE`.
+"""
+
+EXTRACTION_QUEUE = "extraction"
+
+# Priority classes and their broker priority (Redis: 0 is consumed first)
+PRIORITY_CLASSES = {
+    "interactive": 0,
+    "batch": 9,
+}
+
+
+def agent_queue(agent_name: str, priority_class: str) -> str:
+    """Return the queue that receives jobs of an agent in a priority class."""
+    return f"agents.{agent_name}.{priority_class}"
@@ -0,0 +1,46 @@
+"""
+Per-event-loop asyncio Redis clients.
+
+asyncio Redis connections are bound to the event loop that created them, so a
+component used from several loops (a Celery worker restarting its loop, tests
+calling `asyncio.run` repeatedly) needs a client per loop.  `LoopLocalRedis`
+creates one lazily and closes the previous client whenever the running loop
+changes, instead of leaving its connections open.  It is meant for components
+that move from one loop to another, not ones used from several loops at once.
+"""
+import asyncio
+import os
+from typing import Any, Optional
+
+import redis.asyncio as aioredis
+
+
+def _close(client: aioredis.Redis, loop: asyncio.AbstractEventLoop, pid: int) -> None:
+    """Close a client created on `loop`, which the caller no longer runs on."""
+    if pid != os.getpid():
+        # Inherited from the parent process, which still owns the connections
+        return
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    # A stopped or closed loop can no longer run the close; its transports
+    # close their sockets once the client is garbage collected
+
+
+class LoopLocalRedis:
+    def __init__(self, url: str, **kwargs: Any) -> None:
+        self.url = url
+        self.kwargs = kwargs
+        self._client: Optional[aioredis.Redis] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid = 0
+
+    def get(self) -> aioredis.Redis:
+        """Return the client of the running loop, replacing the previous loop's."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop or self._pid != os.getpid():
+            if self._client is not None and self._loop is not None:
+                _close(self._client, self._loop, self._pid)
+            self._client = aioredis.from_url(self.url, **self.kwargs)
+            self._loop = loop
+            self._pid = os.getpid()
+        return self._client
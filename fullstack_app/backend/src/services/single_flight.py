@@ -0,0 +1,171 @@
+"""
+Single-flight coalescing of identical concurrent work.
+
+`SingleFlight.do(key, fn)` runs `fn` once per key at a time: callers that
+arrive while a call with the same key is in flight await the same future
+instead of starting their own.  Keys are content or prompt hashes chosen by
+the caller.  A cancelled caller leaves the call running for the others; the
+call itself is cancelled only once every caller waiting on it is.
+
+When `SINGLE_FLIGHT_REDIS_URL` is set, the leader of a key also takes a Redis
+lock (`SET NX` with a `SINGLE_FLIGHT_LOCK_TTL` second expiry), so identical
+work in other processes is coalesced too: a process that finds the lock taken
+waits for it to be released and then reads the result through the caller's
+`lookup` (typically a shared cache the leader fills).  The leader extends the
+lock while its call runs, so the expiry only matters when the leader dies.
+Without a `lookup`, or if Redis is unreachable, coalescing is in-process only.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import redis.asyncio as aioredis
+
+from .redis_client import LoopLocalRedis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LOCK_TTL = float(os.environ.get("SINGLE_FLIGHT_LOCK_TTL", "300"))
+_LOCK_POLL_INTERVAL = 0.1
+
+# Delete the lock only if this process still owns it
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Extend the lock only if this process still owns it.  ARGV: token, expiry in ms.
+_EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    def __init__(self, name: str, redis_url: Optional[str] = None, lock_ttl: float = LOCK_TTL) -> None:
+        self.name = name
+        self.redis_url = redis_url
+        self.lock_ttl = lock_ttl
+        self._inflight: Dict[str, "asyncio.Future[Any]"] = {}
+        # Callers awaiting each in-flight future
+        self._waiters: Dict["asyncio.Future[Any]", int] = {}
+        self._redis = LoopLocalRedis(redis_url, decode_responses=True) if redis_url else None
+        # calls: total, coalesced: joined an in-flight call in this process,
+        # remote_coalesced: served by another process's call
+        self.stats: Dict[str, int] = {"calls": 0, "coalesced": 0, "remote_coalesced": 0}
+
+    @property
+    def client(self) -> aioredis.Redis:
+        assert self._redis is not None
+        return self._redis.get()
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        lookup: Optional[Callable[[], Awaitable[Optional[T]]]] = None,
+    ) -> T:
+        """
+        Return the result of `fn`, sharing one execution between concurrent
+        callers with the same `key`.  Exceptions are shared as well, and so is
+        cancellation once the last waiting caller is cancelled.
+        """
+        self.stats["calls"] += 1
+        future = self._inflight.get(key)
+        if future is not None and future.get_loop() is asyncio.get_running_loop():
+            self.stats["coalesced"] += 1
+        else:
+            future = asyncio.ensure_future(self._lead(key, fn, lookup))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._inflight.pop(key, None) if self._inflight.get(key) is f else None)
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            # Shielded so a cancelled caller does not abort the call for the others
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._waiters.get(future) == 1 and not future.done():
+                # Nobody is left to use the result; stop spending on it
+                future.cancel()
+            raise
+        finally:
+            remaining = self._waiters.pop(future, 1) - 1
+            if remaining:
+                self._waiters[future] = remaining
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[T]], lookup: Optional[Callable[[], Awaitable[Optional[T]]]]) -> T:
+        if self.redis_url is None or lookup is None:
+            return await fn()
+        lock_key = f"singleflight:{self.name}:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired, result = await self._acquire(lock_key, token, lookup)
+        except (aioredis.RedisError, OSError) as exc:
+            logger.warning("Single-flight lock unavailable, coalescing in-process only: %s", exc)
+            return await fn()
+        if not acquired:
+            self.stats["remote_coalesced"] += 1
+            return result  # type: ignore[return-value]
+        renewal = asyncio.ensure_future(self._renew(lock_key, token))
+        try:
+            return await fn()
+        finally:
+            renewal.cancel()
+            try:
+                await self.client.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+            except (aioredis.RedisError, OSError):
+                pass
+
+    async def _renew(self, lock_key: str, token: str) -> None:
+        """Keep extending the lock until cancelled or no longer owned."""
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            try:
+                if not await self.client.eval(_EXTEND_SCRIPT, 1, lock_key, token, int(self.lock_ttl * 1000)):
+                    logger.warning("Single-flight lock %s lost while its call was running", lock_key)
+                    return
+            except (aioredis.RedisError, OSError) as exc:
+                logger.warning("Cannot extend single-flight lock %s: %s", lock_key, exc)
+
+    async def _acquire(
+        self, lock_key: str, token: str, lookup: Callable[[], Awaitable[Optional[T]]]
+    ) -> Tuple[bool, Optional[T]]:
+        """
+        Take the lock, or wait for its holder and return the result it left
+        behind.  Returns `(True, None)` if the lock was taken and `(False,
+        result)` if another process produced the result.  The holder keeps
+        the lock alive while it works, so this waits as long as it runs; a
+        holder that died loses the lock when it expires.
+        """
+        while True:
+            if await self.client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                return True, None
+            while await self.client.exists(lock_key):
+                await asyncio.sleep(_LOCK_POLL_INTERVAL)
+            # The holder failed if it left no result; try to take over
+            result = await lookup()
+            if result is not None:
+                return False, result
+
+
+_flights: Dict[str, SingleFlight] = {}
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Return the process-wide single-flight group `name`."""
+    flight = _flights.get(name)
+    if flight is None:
+        flight = _flights.setdefault(name, SingleFlight(name, os.environ.get("SINGLE_FLIGHT_REDIS_URL") or None))
+    return flight
+
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    """Coalescing counters of every single-flight group in this process."""
+    return {name: dict(flight.stats) for name, flight in _flights.items()}
@@ -2,19 +2,161 @@
 Celery tasks for executing agents.  Each task is responsible for running an agent and
 updating the job manager with progress.  Tasks must catch exceptions and update
 job status accordingly.
+
+Task bodies are coroutines executed on the worker process's long-lived event
+loop (see `services.event_loop`), so pooled connections survive between tasks.
+
+Uploaded files are extracted by `extract_file_task` on the extraction queue
+rather than in the API process, so CPU-bound parsing never competes with
+request handling and the text lands in the workers' extraction cache, where
+agent runs look for it.
 """
 import asyncio
-import os
-from typing import Dict, List, Optional
+import logging
+import time
+from typing import Any, Awaitable, Dict, List, Optional
 
-from celery import shared_task
+from celery import chord, shared_task
 
+from .services import metrics
+from .services.event_loop import worker_loop
 from .services.job_manager import job_manager, JobStatus
+from .services.queues import EXTRACTION_QUEUE, PRIORITY_CLASSES, agent_queue
 from .agents import load_agent
+from .utils.document_extractor import extract_text_from_file, is_cacheable
+
+logger = logging.getLogger(__name__)
+
+
+async def run_agent_job(
+    job_id: str,
+    agent_name: str,
+    input_text: Optional[str],
+    files: Optional[List[Dict[str, str]]],
+    parent_id: Optional[str] = None,
+    force: bool = False,
+) -> Any:
+    """
+    Run an agent for a job and record its progress and outcome in the job
+    manager.  Exceptions mark the job as failed and are re-raised.  Jobs that
+    belong to a batch also update the progress of their `parent_id`.  `force`
+    makes the agent ignore memoized results of earlier runs.
+
+    The job's queue wait, execution time and per-stage timings are stored in
+    its `timings` field when it completes or fails.
+    """
+    job = await job_manager.get_job(job_id, logs_from=None)
+    started = time.time()
+    queue_wait = max(0.0, started - job["created_at"]) if job else 0.0
+    # Mark job as running; a job cancelled while queued is skipped
+    if not await job_manager.update_job(
+        job_id, JobStatus.RUNNING, log=f"Starting agent '{agent_name}'", fields={"started_at": started}
+    ):
+        if parent_id:
+            await job_manager.record_child_result(parent_id, job_id, JobStatus.CANCELLED)
+        return None
+    if metrics.METRICS_ENABLED:
+        metrics.JOB_QUEUE_SECONDS.observe(queue_wait, agent=agent_name)
+    timings = metrics.JobTimings()
+    token = metrics.job_timings.set(timings)
+
+    def finished(status: str) -> Dict[str, Any]:
+        execution = time.time() - started
+        if metrics.METRICS_ENABLED:
+            metrics.JOB_EXECUTION_SECONDS.observe(execution, agent=agent_name, status=status)
+        return {"timings": {"queue_wait": round(queue_wait, 3), "execution": round(execution, 3), **timings.snapshot()}}
+
+    try:
+        agent_cls = load_agent(agent_name)
+        agent = agent_cls(force=force)
+        with metrics.span("agent_run"):
+            result = await _run_cancellable(job_id, agent.run(job_id=job_id, input_text=input_text, files=files))
+        if result is _CANCELLED:
+            # The cancelled job is already final, so only the metrics record its timings
+            finished(JobStatus.CANCELLED)
+            if parent_id:
+                await job_manager.record_child_result(parent_id, job_id, JobStatus.CANCELLED)
+            return None
+        # Save result: for TSD agent this may be a file path; for ABAP agent it may be text
+        await job_manager.update_job(
+            job_id, JobStatus.COMPLETED, log="Agent completed", result=result, fields=finished(JobStatus.COMPLETED)
+        )
+        if parent_id:
+            await job_manager.record_child_result(parent_id, job_id, JobStatus.COMPLETED)
+        return result
+    except Exception as exc:
+        # Capture exception and update job as failed
+        await job_manager.update_job(job_id, JobStatus.FAILED, log=str(exc), result=None, fields=finished(JobStatus.FAILED))
+        if parent_id:
+            await job_manager.record_child_result(parent_id, job_id, JobStatus.FAILED)
+        raise
+    finally:
+        metrics.job_timings.reset(token)
+
+
+_CANCELLED = object()
+
+
+async def _run_cancellable(job_id: str, coro: Awaitable[Any]) -> Any:
+    """
+    Run an agent coroutine until it finishes or the job is cancelled.  On
+    cancellation the agent task is cancelled, which aborts its pending
+    provider requests, and `_CANCELLED` is returned.  If watching for
+    cancellation fails (e.g. the job store is unreachable), the failure is
+    logged and the agent runs to completion.
+    """
+    work = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(job_manager.wait_cancelled(job_id))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except BaseException:
+        work.cancel()
+        watcher.cancel()
+        raise
+    if work.done():
+        watcher.cancel()
+        return work.result()
+    error = watcher.exception()
+    if error is not None:
+        logger.warning("Cannot watch job %s for cancellation, running it to completion: %r", job_id, error)
+        return await work
+    work.cancel()
+    try:
+        await work
+    except (asyncio.CancelledError, Exception):
+        pass
+    return _CANCELLED
+
+
+async def finalize_batch(parent_id: str) -> None:
+    """Mark a batch parent job finished once all of its children have run."""
+    parent = await job_manager.get_job(parent_id)
+    if parent is None:
+        return
+    progress = parent["progress"]
+    status = JobStatus.FAILED if progress["completed"] == 0 and progress["total"] else JobStatus.COMPLETED
+    result = {"children": parent["children"], **progress}
+    await job_manager.update_job(
+        parent_id,
+        status,
+        log=(
+            f"Batch finished: {progress['completed']} completed, {progress['failed']} failed, "
+            f"{progress['cancelled']} cancelled"
+        ),
+        result=result,
+    )
 
 
 @shared_task(bind=True)
-def run_agent_task(self, job_id: str, agent_name: str, input_text: Optional[str], files: Optional[List[Dict[str, str]]]) -> None:
+def run_agent_task(
+    self,
+    job_id: str,
+    agent_name: str,
+    input_text: Optional[str],
+    files: Optional[List[Dict[str, str]]],
+    parent_id: Optional[str] = None,
+    force: bool = False,
+) -> Optional[str]:
     """
     Celery task that runs a specified agent.
 
@@ -23,18 +165,95 @@ def run_agent_task(self, job_id: str, agent_name: str, input_text: Optional[str]
         agent_name: Name of the agent to execute.
         input_text: User provided input text (may be None if files supplied).
         files: List of file metadata dicts with `path` keys.
+        parent_id: Batch parent job, if the job is part of a batch.
+        force: Ignore memoized results of earlier runs.
+
+    Returns:
+        The final job status for batch children, whose failures must not
+        abort the batch; None otherwise.
     """
-    # Mark job as running
-    asyncio.run(job_manager.update_job(job_id, JobStatus.RUNNING, log=f"Starting agent '{agent_name}'"))
+    if parent_id is None:
+        # Exceptions propagate for Celery logging
+        worker_loop.run(run_agent_job(job_id, agent_name, input_text, files, force=force))
+        return None
     try:
-        agent_cls = load_agent(agent_name)
-        agent = agent_cls()
-        # The agent `run` method is asynchronous; call it via asyncio.run
-        result = asyncio.run(agent.run(job_id=job_id, input_text=input_text, files=files))
-        # Save result: for TSD agent this may be a file path; for ABAP agent it may be text
-        asyncio.run(job_manager.update_job(job_id, JobStatus.COMPLETED, log="Agent completed", result=result))
-    except Exception as exc:
-        # Capture exception and update job as failed
-        asyncio.run(job_manager.update_job(job_id, JobStatus.FAILED, log=str(exc), result=None))
-        # Re‑raise for Celery logging
-        raise exc
\ No newline at end of file
+        worker_loop.run(run_agent_job(job_id, agent_name, input_text, files, parent_id, force))
+    except Exception:
+        return JobStatus.FAILED
+    return JobStatus.COMPLETED
+
+
+@shared_task(bind=True)
+def extract_file_task(self, path: str, content_type: Optional[str], digest: Optional[str]) -> None:
+    """Celery task that extracts an uploaded file into the extraction cache."""
+    worker_loop.run(extract_text_from_file(path, content_type, digest))
+
+
+@shared_task(bind=True)
+def finalize_batch_task(self, statuses: List[Optional[str]], parent_id: str) -> None:
+    """Chord callback that completes a batch parent job."""
+    worker_loop.run(finalize_batch(parent_id))
+
+
+def submit_agent_job(
+    job_id: str,
+    agent_name: str,
+    input_text: Optional[str],
+    files: Optional[List[Dict[str, str]]],
+    priority_class: Optional[str] = None,
+    force: bool = False,
+) -> None:
+    """
+    Dispatch an agent job to the queue of its agent and priority class.  The
+    agent's `default_priority` is used when no class is given.
+    """
+    agent_cls = load_agent(agent_name)
+    priority_class = priority_class or agent_cls.default_priority
+    if priority_class not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class '{priority_class}'")
+    run_agent_task.apply_async(
+        args=(job_id, agent_name, input_text, files),
+        kwargs={"force": force},
+        queue=agent_queue(agent_cls.name, priority_class),
+        priority=PRIORITY_CLASSES[priority_class],
+    )
+
+
+def submit_extraction(path: str, content_type: Optional[str], digest: str) -> bool:
+    """
+    Queue extraction of an uploaded file so its text is cached before an agent
+    asks for it.  `digest` is the SHA-256 the upload handler computed.
+    Returns False when there is nothing to precompute.
+    """
+    if not is_cacheable(path, content_type):
+        return False
+    extract_file_task.apply_async(args=(path, content_type, digest), queue=EXTRACTION_QUEUE)
+    return True
+
+
+def submit_agent_batch(
+    parent_id: str,
+    child_ids: List[str],
+    agent_name: str,
+    items: List[Dict[str, Any]],
+    priority_class: Optional[str] = None,
+) -> None:
+    """
+    Dispatch the child jobs of a batch as a Celery chord whose callback
+    finalizes the parent job.  Children share the queue of their agent and
+    priority class (`batch` unless given).
+    """
+    agent_cls = load_agent(agent_name)
+    priority_class = priority_class or "batch"
+    if priority_class not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class '{priority_class}'")
+    options = {"queue": agent_queue(agent_cls.name, priority_class), "priority": PRIORITY_CLASSES[priority_class]}
+    header = [
+        run_agent_task.signature(
+            args=(child_id, agent_name, item.get("input_text"), item.get("files"), parent_id),
+            kwargs={"force": bool(item.get("force"))},
+            **options,
+        )
+        for child_id, item in zip(child_ids, items)
+    ]
+    chord(header)(finalize_batch_task.signature(args=(parent_id,), **options))
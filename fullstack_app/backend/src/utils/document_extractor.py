@@ -3,24 +3,78 @@ File extraction utilities.  This module implements functions to extract text fro
 uploaded files of different types.  Extraction is asynchronous where possible to
 avoid blocking the event loop.  Image OCR is stubbed out for future
 implementation.
+
+Large PDFs are split into page ranges and extracted in parallel on a process
+pool, since pdfplumber is CPU-bound and a thread would hold the GIL.  The pool
+is tuned with `PDF_WORKERS` (processes, default: CPU count),
+`PDF_SHARD_MIN_PAGES` (smaller documents stay on a thread, default 32),
+`PDF_PAGES_PER_SHARD` (default 16) and `PDF_MAX_INFLIGHT_SHARDS` (default: two
+per worker).
+
+Extracted text is cached by file content hash (see `extraction_cache`), so
+re-running an agent on the same upload skips parsing entirely.  Bump
+`EXTRACTOR_VERSION` whenever extraction output changes.
+
+Uploads queue an extraction task on the Celery workers (see
+`tasks.submit_extraction`) so agent runs usually find the text already cached.
+A caller that asks for a file whose extraction is still running waits for it
+instead of extracting it again: within a process through the `extraction`
+single-flight group, across processes through a pending marker in the cache
+or the single-flight Redis lock when configured.  The extracting process
+refreshes its marker; one not refreshed for `EXTRACTION_WAIT_SECONDS` is
+treated as abandoned.
 """
 import asyncio
 import csv
 import io
+import logging
 import mimetypes
+import multiprocessing
 import os
-from typing import List, Dict, Optional
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, List, Dict, Optional
 
 import pdfplumber
 import pandas as pd
 from docx import Document
 
+from .extraction_cache import extraction_cache, hash_file
+from ..services import metrics
+from ..services.single_flight import get_single_flight
+
+EXTRACTOR_VERSION = "1"
+
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_SHARD_MIN_PAGES = int(os.environ.get("PDF_SHARD_MIN_PAGES", "32"))
+PDF_PAGES_PER_SHARD = int(os.environ.get("PDF_PAGES_PER_SHARD", "16"))
+PDF_MAX_INFLIGHT_SHARDS = int(os.environ.get("PDF_MAX_INFLIGHT_SHARDS", str(2 * PDF_WORKERS)))
+EXTRACTION_WAIT_SECONDS = float(os.environ.get("EXTRACTION_WAIT_SECONDS", "60"))
+_PENDING_POLL_INTERVAL = 0.25
+
+logger = logging.getLogger(__name__)
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+# Set once it is known that this process cannot start a pool
+_pdf_pool_unavailable = False
+_pdf_pool_lock = threading.Lock()
+
+# Concurrent extractions of the same content share one run
+_extraction_flight = get_single_flight("extraction")
+
+metrics.register_cache("extraction", extraction_cache.hit_counts)
+
 
 async def extract_text_from_files(files: Optional[List[Dict[str, str]]]) -> str:
     """
     Concatenate the extracted text from a list of files.  Each file dict must
     include the path to the stored file and optionally the MIME type.  The
     returned string contains a newline between files.
+
+    Files are always hashed here: a `sha256` in the dict comes from the
+    client, and trusting it would let a caller store text under another
+    file's cache key.
     """
     if not files:
         return ""
@@ -29,36 +83,153 @@ async def extract_text_from_files(files: Optional[List[Dict[str, str]]]) -> str:
     return "\n\n".join(texts)
 
 
-async def extract_text_from_file(path: str, content_type: Optional[str] = None) -> str:
+async def extract_text_from_file(path: str, content_type: Optional[str] = None, digest: Optional[str] = None) -> str:
     """
     Extract text from a single file based on its MIME type or extension.
+    Results are served from the extraction cache when the same content has
+    been extracted before.  `digest` is the file's SHA-256 if the server
+    already computed it, which saves re-hashing it; never pass a digest
+    supplied by a client.  The call is timed as the `extract` pipeline
+    stage.
     """
+    kind = _detect_kind(path, content_type)
+    if kind is None:
+        return ""
+    extractor = _EXTRACTORS[kind]
+    with metrics.span("extract"):
+        if not extraction_cache.enabled:
+            return await extractor(path)
+        if digest is None:
+            digest = await asyncio.to_thread(hash_file, path)
+        key = extraction_cache.make_key(digest, kind, EXTRACTOR_VERSION)
+        cached = await extraction_cache.aget(key)
+        if cached is not None:
+            return cached
+        return await _extraction_flight.do(
+            key, lambda: _extract_and_cache(key, extractor, path), lookup=lambda: extraction_cache.aget(key)
+        )
+
+
+async def _extract_and_cache(key: str, extractor: Callable[[str], Awaitable[str]], path: str) -> str:
+    while not await asyncio.to_thread(extraction_cache.mark_pending, key, EXTRACTION_WAIT_SECONDS):
+        # Another process is extracting the same content: use its result
+        while await asyncio.to_thread(extraction_cache.is_pending, key, EXTRACTION_WAIT_SECONDS):
+            await asyncio.sleep(_PENDING_POLL_INTERVAL)
+        cached = await extraction_cache.aget(key)
+        if cached is not None:
+            return cached
+    heartbeat = asyncio.create_task(_refresh_pending(key))
+    try:
+        text = await extractor(path)
+        await extraction_cache.aput(key, text)
+        return text
+    finally:
+        heartbeat.cancel()
+        await asyncio.to_thread(extraction_cache.clear_pending, key)
+
+
+async def _refresh_pending(key: str) -> None:
+    """Keep the pending marker of `key` fresh while this process extracts it."""
+    while True:
+        await asyncio.sleep(EXTRACTION_WAIT_SECONDS / 4)
+        await asyncio.to_thread(extraction_cache.refresh_pending, key)
+
+
+def is_cacheable(path: str, content_type: Optional[str] = None) -> bool:
+    """Whether extracting the file stores its text in the extraction cache."""
+    return extraction_cache.enabled and _detect_kind(path, content_type) is not None
+
+
+def _detect_kind(path: str, content_type: Optional[str]) -> Optional[str]:
     if content_type is None:
         content_type, _ = mimetypes.guess_type(path)
     extension = os.path.splitext(path)[1].lower()
     if content_type == "application/pdf" or extension == ".pdf":
-        return await extract_pdf_text(path)
+        return "pdf"
     elif content_type in ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", "application/msword") or extension == ".docx":
-        return await extract_docx_text(path)
+        return "docx"
     elif content_type == "text/plain" or extension in (".txt", ".log"):
-        return await extract_txt_text(path)
+        return "txt"
     elif content_type == "text/csv" or extension == ".csv":
-        return await extract_csv_text(path)
+        return "csv"
     elif content_type and content_type.startswith("image/") or extension in (".png", ".jpg", ".jpeg", ".bmp"):
-        return await extract_image_text(path)
+        return "image"
     else:
-        return ""
+        return None
+
+
+def _extract_pdf_pages(path: str, start: int = 0, end: Optional[int] = None) -> str:
+    """Extract pages [start, end) of a PDF; each page is followed by a newline."""
+    with pdfplumber.open(path) as pdf:
+        pages = pdf.pages[start:end]
+        return "".join(f"{page.extract_text() or ''}\n" for page in pages)
+
+
+def _count_pdf_pages(path: str) -> int:
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def _get_pdf_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Lazily create the shared PDF process pool.  Returns None when process
+    parallelism is disabled or cannot be used, e.g. inside a Celery prefork
+    child: those are daemonic, and daemonic processes cannot have children
+    (the pool would only fail later, when its workers start on submit).
+    """
+    global _pdf_pool, _pdf_pool_unavailable
+    if PDF_WORKERS <= 1 or _pdf_pool_unavailable:
+        return None
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            if multiprocessing.current_process().daemon:
+                logger.info("Daemonic process, extracting PDFs on a thread; use the threads pool for parallel extraction")
+                _pdf_pool_unavailable = True
+                return None
+            try:
+                # spawn avoids forking a process that has live threads
+                context = multiprocessing.get_context("spawn")
+                _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=context)
+            except OSError as exc:
+                logger.warning("PDF process pool unavailable, extracting on a thread: %s", exc)
+                _pdf_pool_unavailable = True
+                return None
+        return _pdf_pool
+
+
+def _discard_pdf_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next large PDF starts a new one."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
 
 
 async def extract_pdf_text(path: str) -> str:
-    def _extract() -> str:
-        text = ""
-        with pdfplumber.open(path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-                text += "\n"
-        return text
-    return await asyncio.to_thread(_extract)
+    page_count = await asyncio.to_thread(_count_pdf_pages, path)
+    pool = _get_pdf_pool() if page_count >= PDF_SHARD_MIN_PAGES else None
+    if pool is None:
+        return await asyncio.to_thread(_extract_pdf_pages, path)
+    shard = max(1, PDF_PAGES_PER_SHARD)
+    ranges = [(start, min(start + shard, page_count)) for start in range(0, page_count, shard)]
+    loop = asyncio.get_running_loop()
+    # Bound the shards (and so the pages) submitted to the pool at once
+    slots = asyncio.Semaphore(max(1, PDF_MAX_INFLIGHT_SHARDS))
+
+    async def run_shard(start: int, end: int) -> str:
+        async with slots:
+            return await loop.run_in_executor(pool, _extract_pdf_pages, path, start, end)
+
+    try:
+        parts = await asyncio.gather(*(run_shard(start, end) for start, end in ranges))
+    except (BrokenProcessPool, OSError) as exc:
+        logger.warning("Parallel PDF extraction failed, retrying on a thread: %s", exc)
+        if isinstance(exc, BrokenProcessPool):
+            _discard_pdf_pool(pool)
+        return await asyncio.to_thread(_extract_pdf_pages, path)
+    # gather preserves order, so the shards are joined in page order
+    return "".join(parts)
 
 
 async def extract_docx_text(path: str) -> str:
@@ -88,4 +259,13 @@ async def extract_image_text(path: str) -> str:
     library.  Here we return an empty string.
     """
     # Placeholder: implement OCR with pytesseract or similar
-    return ""
\ No newline at end of file
+    return ""
+
+
+_EXTRACTORS: Dict[str, Callable[[str], Awaitable[str]]] = {
+    "pdf": extract_pdf_text,
+    "docx": extract_docx_text,
+    "txt": extract_txt_text,
+    "csv": extract_csv_text,
+    "image": extract_image_text,
+}
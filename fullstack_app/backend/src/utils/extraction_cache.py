@@ -0,0 +1,206 @@
+"""
+Content-addressed cache for extracted document text.  Entries are keyed by the
+SHA-256 of the file bytes, the extractor used and the extractor version, so an
+identical upload never has to be parsed twice and a change to the extraction
+code invalidates old entries automatically.
+
+Entries are stored as text files on disk with size-bounded LRU eviction (the
+file mtime is the recency marker), optionally fronted by a small in-memory LRU.
+Configuration is read from the environment:
+
+  * `EXTRACTION_CACHE_DIR` – cache directory (default `backend/cache/extraction`)
+  * `EXTRACTION_CACHE_MAX_BYTES` – disk budget in bytes (default 1 GiB, 0 disables the cache)
+  * `EXTRACTION_CACHE_MEMORY_ITEMS` – entries kept in memory (default 64, 0 disables the tier)
+
+An entry being computed can be marked pending, so other processes wait for it
+instead of computing it a second time.  The marker is created atomically and
+must be refreshed while the computation runs; one that is not refreshed for
+too long is considered abandoned and can be taken over.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    """Return the hex SHA-256 digest of a file, reading it in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, directory: str, max_bytes: int, memory_items: int = 64) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None
+        self.stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def hit_counts(self) -> Tuple[int, int]:
+        """Return (hits, misses) over both tiers."""
+        return self.stats["memory_hits"] + self.stats["disk_hits"], self.stats["misses"]
+
+    @staticmethod
+    def make_key(digest: str, extractor: str, version: str) -> str:
+        return f"{digest}-{extractor}-{version}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.txt")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached text for `key`, or None on a miss."""
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return text
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            # Mark as recently used for LRU eviction
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["disk_hits"] += 1
+            self._remember(key, text)
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        size = os.path.getsize(tmp_path)
+        try:
+            # An overwritten entry no longer counts towards the budget
+            size -= os.path.getsize(path)
+        except OSError:
+            pass
+        # Atomic rename so concurrent workers never read a partial entry
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._remember(key, text)
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan()[1]
+            else:
+                self._disk_bytes += size
+            over_budget = self._disk_bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+
+    def mark_pending(self, key: str, max_age: float) -> bool:
+        """
+        Mark `key` as being computed by the caller.  Returns False if another
+        caller's marker exists and is younger than `max_age` seconds.
+        """
+        path = self._path(key) + ".pending"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for _ in range(2):
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                if self.is_pending(key, max_age):
+                    return False
+                # Abandoned by its owner: remove it and try to create it again
+                self.clear_pending(key)
+        return False
+
+    def refresh_pending(self, key: str) -> None:
+        try:
+            os.utime(self._path(key) + ".pending")
+        except OSError:
+            pass
+
+    def clear_pending(self, key: str) -> None:
+        try:
+            os.remove(self._path(key) + ".pending")
+        except OSError:
+            pass
+
+    def is_pending(self, key: str, max_age: float) -> bool:
+        """Whether `key` is being computed; markers older than `max_age` seconds are stale."""
+        try:
+            return time.time() - os.stat(self._path(key) + ".pending").st_mtime < max_age
+        except OSError:
+            return False
+
+    def _remember(self, key: str, text: str) -> None:
+        if self.memory_items <= 0:
+            return
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _scan(self) -> Tuple[List[Tuple[float, int, str]], int]:
+        entries: List[Tuple[float, int, str]] = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        return entries, total
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache fits its budget."""
+        entries, total = self._scan()
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    async def aget(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, text: str) -> None:
+        await asyncio.to_thread(self.put, key, text)
+
+
+_DEFAULT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "cache", "extraction"))
+
+extraction_cache = ExtractionCache(
+    os.environ.get("EXTRACTION_CACHE_DIR", _DEFAULT_DIR),
+    max_bytes=int(os.environ.get("EXTRACTION_CACHE_MAX_BYTES", str(1024 ** 3))),
+    memory_items=int(os.environ.get("EXTRACTION_CACHE_MEMORY_ITEMS", "64")),
+)
@@ -0,0 +1,18 @@
+"""
+Helpers for Server‑Sent Events responses.
+"""
+from typing import Optional, Union
+
+
+def format_sse(data: str, event: Optional[str] = None, event_id: Optional[Union[int, str]] = None) -> str:
+    """
+    Format a Server‑Sent Event.  Multi-line payloads are split across several
+    `data:` fields as required by the SSE specification.
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
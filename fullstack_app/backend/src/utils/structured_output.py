@@ -0,0 +1,216 @@
+"""
+Parsing of structured (JSON) model output for table sections.
+
+Table sections are requested as `{"rows": [{...}, ...]}` following a JSON
+schema derived from the section's `columns` in `sections.json`.
+`RowStreamParser` can consume the output in chunks and returns every row as
+soon as its closing brace arrives; table sections feed it the complete reply,
+which is what the response cache stores.  A garbled row costs only that row.  Rows that are not valid JSON are
+repaired (trailing commas, raw newlines in strings, truncation) before being
+dropped, and plain pipe-delimited tables are still accepted as a last resort
+before the caller re-prompts.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_SEPARATOR_LINE = re.compile(r"^[\s|:\-+]+$")
+
+
+def table_schema(columns: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Return the JSON schema of a table section's output."""
+    if columns:
+        row: Dict[str, Any] = {
+            "type": "object",
+            "properties": {column: {"type": "string"} for column in columns},
+            "required": list(columns),
+        }
+    else:
+        row = {"type": "object", "additionalProperties": {"type": "string"}}
+    return {
+        "type": "object",
+        "properties": {"rows": {"type": "array", "items": row}},
+        "required": ["rows"],
+    }
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Best-effort parse of a malformed JSON value: escapes raw control characters
+    inside strings, drops trailing commas and closes unterminated strings and
+    brackets.  If that still fails, the value is cut back to its last complete
+    member.  Returns None if nothing parseable remains.
+    """
+    for _ in range(16):
+        out: List[str] = []
+        stack: List[str] = []
+        in_string = escape = False
+        for c in text:
+            if in_string:
+                if escape:
+                    escape = False
+                elif c == "\\":
+                    escape = True
+                elif c == '"':
+                    in_string = False
+                elif c == "\n":
+                    c = "\\n"
+                elif c in "\r\t":
+                    c = "\\r" if c == "\r" else "\\t"
+            elif c == '"':
+                in_string = True
+            elif c in "{[":
+                stack.append("}" if c == "{" else "]")
+            elif c in "}]" and stack:
+                stack.pop()
+            out.append(c)
+        if in_string:
+            out.append('"')
+        candidate = _TRAILING_COMMA.sub(r"\1", "".join(out).rstrip().rstrip(",") + "".join(reversed(stack)))
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            cut = text.rfind(",")
+            if cut <= 0:
+                return None
+            text = text[:cut]
+    return None
+
+
+def normalize_row(value: Any, columns: Optional[Sequence[str]] = None) -> Optional[Dict[str, str]]:
+    """
+    Validate a parsed row against the table columns.  Keys are matched
+    case-insensitively, missing cells become empty strings and non-string
+    values are converted.  Returns None for rows that do not fit the table.
+    """
+    if not isinstance(value, dict) or not value:
+        return None
+
+    def cell(v: Any) -> str:
+        if v is None:
+            return ""
+        return v if isinstance(v, str) else json.dumps(v) if isinstance(v, (list, dict)) else str(v)
+
+    if not columns:
+        return {str(k): cell(v) for k, v in value.items()}
+    lookup = {str(k).strip().lower(): v for k, v in value.items()}
+    if not any(column.lower() in lookup for column in columns):
+        return None
+    return {column: cell(lookup.get(column.lower())) for column in columns}
+
+
+class RowStreamParser:
+    """
+    Incremental parser for the rows of a JSON table.  Rows are the objects
+    directly inside the first array of the output, so `{"rows": [...]}`, a bare
+    array, and output wrapped in prose or code fences are all accepted.
+    """
+
+    def __init__(self, columns: Optional[Sequence[str]] = None) -> None:
+        self.columns = columns
+        self.rows: List[Dict[str, str]] = []
+        self.repaired = 0
+        self.invalid = 0
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._row_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Dict[str, str]]:
+        """Consume a chunk of output and return the rows it completed."""
+        if self._finished:
+            return []
+        self._buffer += chunk
+        new_rows: List[Dict[str, str]] = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            c = buffer[i]
+            if not self._in_array:
+                # Skip everything up to the opening bracket of the rows array
+                if c == "[":
+                    self._in_array = True
+                    self._depth = 0
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                if self._depth == 0 and c == "{":
+                    self._row_start = i
+                self._depth += 1
+            elif c in "}]":
+                if self._depth == 0:
+                    if c == "]":
+                        self._in_array = False
+                        # An empty array is a stray bracket in a preamble
+                        self._finished = bool(self.rows or new_rows)
+                        if self._finished:
+                            break
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._row_start is not None:
+                        self._add_row(buffer[self._row_start : i + 1], new_rows)
+                        self._row_start = None
+                        # Drop consumed output so the buffer only holds the current row
+                        buffer = buffer[i + 1 :]
+                        i = -1
+            i += 1
+        self._buffer = buffer
+        self._pos = len(buffer)
+        return new_rows
+
+    def close(self) -> List[Dict[str, str]]:
+        """Finish parsing, repairing a row cut off by the end of the output."""
+        new_rows: List[Dict[str, str]] = []
+        if not self._finished and self._row_start is not None:
+            self._add_row(self._buffer[self._row_start :], new_rows)
+            self._row_start = None
+        self._finished = True
+        return new_rows
+
+    def _add_row(self, text: str, new_rows: List[Dict[str, str]]) -> None:
+        try:
+            value = json.loads(text)
+        except ValueError:
+            value = repair_json(text)
+            if value is not None:
+                self.repaired += 1
+        row = normalize_row(value, self.columns)
+        if row is None:
+            self.invalid += 1
+            return
+        self.rows.append(row)
+        new_rows.append(row)
+
+
+def parse_pipe_table(text: str, columns: Optional[Sequence[str]] = None) -> List[Dict[str, str]]:
+    """
+    Parse a pipe-delimited (e.g. markdown) table.  Lines without pipes, such
+    as a preamble, and separator lines like `---|---` are skipped; leading and
+    trailing pipes are ignored.
+    """
+    rows: List[Dict[str, str]] = []
+    headers: Optional[List[str]] = None
+    for line in text.splitlines():
+        line = line.strip()
+        if "|" not in line or _SEPARATOR_LINE.match(line):
+            continue
+        cells = [cell.strip() for cell in line.strip("|").split("|")]
+        if headers is None:
+            headers = cells
+            continue
+        row = normalize_row({h: cells[i] if i < len(cells) else "" for i, h in enumerate(headers)}, columns)
+        if row is not None:
+            rows.append(row)
+    return rows
@@ -0,0 +1,155 @@
+"""
+Shared fixtures.  `mock_llm` serves an in-process mock of the OpenAI chat
+completions and Anthropic Messages APIs.  The behaviour of each request is
+chosen by its model name: `fast` and `slow` answer after `FAST_DELAY` and
+`SLOW_DELAY` seconds and `broken` fails with a 500.  Requests abandoned by the
+client are recorded in `disconnected`.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List
+
+import pytest
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# Provider failures must reach the router instead of being retried
+os.environ.setdefault("LLM_MAX_RETRIES", "0")
+os.environ.setdefault("LLM_CACHE", "off")
+os.environ.setdefault("JOB_STORE", "memory")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+FAST_DELAY = 0.05
+SLOW_DELAY = 1.0
+_POLL_INTERVAL = 0.01
+
+
+class MockLLM:
+    def __init__(self) -> None:
+        self.url = ""
+        self.requests: List[str] = []
+        self.disconnected: List[str] = []
+
+    async def _wait(self, request: Request, model: str) -> bool:
+        """Sleep for the model's delay; return False if the client went away."""
+        deadline = time.monotonic() + (SLOW_DELAY if model == "slow" else FAST_DELAY)
+        while time.monotonic() < deadline:
+            if await request.is_disconnected():
+                self.disconnected.append(model)
+                return False
+            await asyncio.sleep(_POLL_INTERVAL)
+        return True
+
+    async def _events(self, model: str, events: List[Dict[str, Any]], done: bool) -> AsyncIterator[str]:
+        try:
+            for event in events:
+                yield f"data: {json.dumps(event)}\n\n"
+                await asyncio.sleep(_POLL_INTERVAL)
+            if done:
+                yield "data: [DONE]\n\n"
+        except asyncio.CancelledError:
+            self.disconnected.append(model)
+            raise
+
+    async def chat_completions(self, request: Request) -> Response:
+        body = await request.json()
+        model = body["model"]
+        self.requests.append(model)
+        if model == "broken":
+            return JSONResponse({"error": {"message": "boom"}}, status_code=500)
+        if not await self._wait(request, model):
+            return Response(status_code=499)
+        words = [model, " says", " hi"]
+        if body.get("stream"):
+            chunks = [
+                {
+                    "id": "x",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+                }
+                for word in words
+            ]
+            return StreamingResponse(self._events(model, chunks, done=True), media_type="text/event-stream")
+        return JSONResponse({
+            "id": "x",
+            "object": "chat.completion",
+            "created": 0,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 3, "total_tokens": 4},
+        })
+
+    async def messages(self, request: Request) -> Response:
+        body = await request.json()
+        model = body["model"]
+        self.requests.append(model)
+        if model == "broken":
+            return JSONResponse({"type": "error", "error": {"type": "api_error", "message": "boom"}}, status_code=500)
+        if not await self._wait(request, model):
+            return Response(status_code=499)
+        if not body.get("stream"):
+            return JSONResponse({
+                "id": "msg",
+                "type": "message",
+                "role": "assistant",
+                "content": [{"type": "text", "text": f"{model} says hi"}],
+            })
+        events = [
+            {"type": "message_start", "message": {"id": "msg", "type": "message", "role": "assistant", "content": []}},
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+            {"type": "ping"},
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": model}},
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": " says hi"}},
+            {"type": "content_block_stop", "index": 0},
+            {"type": "message_delta", "delta": {"stop_reason": "end_turn"}},
+            {"type": "message_stop"},
+        ]
+
+        async def stream() -> AsyncIterator[str]:
+            # Anthropic names every event and sends pings between them
+            async for data in self._events(model, events, done=False):
+                event_type = json.loads(data[6:])["type"]
+                yield f"event: {event_type}\n{data}"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/v1/chat/completions", self.chat_completions, methods=["POST"]),
+            Route("/v1/messages", self.messages, methods=["POST"]),
+        ])
+
+
+@pytest.fixture(scope="session")
+def mock_llm_server() -> Iterator[MockLLM]:
+    mock = MockLLM()
+    server = uvicorn.Server(uvicorn.Config(mock.app(), host="127.0.0.1", port=0, log_level="warning", lifespan="off", ws="none"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(_POLL_INTERVAL)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    mock.url = f"http://127.0.0.1:{port}"
+    yield mock
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+@pytest.fixture
+def mock_llm(mock_llm_server: MockLLM, monkeypatch: pytest.MonkeyPatch) -> MockLLM:
+    """The mock server, with provider URLs pointing at it and a clean request log."""
+    monkeypatch.setenv("LOCAL_LLM_BASE_URL", f"{mock_llm_server.url}/v1")
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", mock_llm_server.url)
+    monkeypatch.setenv("LLM_HTTP2", "0")
+    mock_llm_server.requests.clear()
+    mock_llm_server.disconnected.clear()
+    return mock_llm_server
@@ -0,0 +1,13 @@
+"""
+Extraction cache disk accounting.
+"""
+from src.utils.extraction_cache import ExtractionCache
+
+
+def test_overwriting_an_entry_keeps_the_disk_total(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_bytes=1000, memory_items=0)
+    cache.put("aa", "x" * 40)
+    for _ in range(3):
+        cache.put("bb", "y" * 40)
+
+    assert cache._disk_bytes == 80
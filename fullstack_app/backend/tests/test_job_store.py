@@ -0,0 +1,42 @@
+"""
+In-memory job store snapshots and expiry.
+"""
+import asyncio
+import time
+
+from src.services.job_manager import InMemoryJobStore, JobStatus
+
+
+def _job(job_id: str) -> dict:
+    return {"id": job_id, "status": JobStatus.QUEUED, "logs": [], "result": None, "created_at": time.time()}
+
+
+def test_snapshots_do_not_share_the_result():
+    store = InMemoryJobStore()
+
+    async def run() -> dict:
+        await store.create(_job("a"))
+        await store.update("a", JobStatus.COMPLETED, result={"sections": ["intro"]})
+        snapshot = await store.get("a")
+        snapshot["result"]["sections"].append("mutated")
+        return await store.get("a")
+
+    assert asyncio.run(run())["result"] == {"sections": ["intro"]}
+
+
+def test_abandoned_active_jobs_expire(monkeypatch):
+    store = InMemoryJobStore(active_ttl=60)
+    now = time.time()
+
+    async def run() -> tuple:
+        await store.create(_job("orphan"))
+        await store.create(_job("live"))
+        monkeypatch.setattr(time, "time", lambda: now + 45)
+        await store.update("live", JobStatus.RUNNING, log="working")
+        monkeypatch.setattr(time, "time", lambda: now + 90)
+        await store.create(_job("new"))
+        return await store.get("orphan"), await store.get("live")
+
+    orphan, live = asyncio.run(run())
+    assert orphan is None and live["status"] == JobStatus.RUNNING
+    assert len(store) == 2
@@ -0,0 +1,94 @@
+"""
+Provider limiter behaviour.
+"""
+import asyncio
+from typing import List
+
+import pytest
+
+from src.models.providers import LocalOpenAIProvider
+from src.models.rate_limit import ProviderLimiter, get_limiter
+
+
+def test_call_releases_its_slot():
+    limiter = ProviderLimiter("test:call")
+
+    async def run() -> int:
+        async def fn() -> int:
+            assert limiter.concurrency.in_flight == 1
+            return 1
+
+        return await limiter.call(fn)
+
+    assert asyncio.run(run()) == 1
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_stream_holds_its_slot_until_closed():
+    limiter = ProviderLimiter("test:stream")
+
+    async def run() -> List[int]:
+        async def open_stream() -> str:
+            return "stream"
+
+        seen = []
+        async with limiter.stream(open_stream):
+            seen.append(limiter.concurrency.in_flight)
+        seen.append(limiter.concurrency.in_flight)
+        return seen
+
+    assert asyncio.run(run()) == [1, 0]
+
+
+def test_provider_stream_is_limited_for_its_whole_life(mock_llm):
+    provider = LocalOpenAIProvider("local/fast")
+    concurrency = get_limiter(provider.provider_name, provider.model_name).concurrency
+
+    async def run() -> List[int]:
+        in_flight = [concurrency.in_flight async for _ in provider.stream("hello")]
+        return in_flight + [concurrency.in_flight]
+
+    assert asyncio.run(run()) == [1, 1, 1, 0]
+
+
+def test_abandoned_stream_releases_its_slot(mock_llm):
+    provider = LocalOpenAIProvider("local/slow")
+    concurrency = get_limiter(provider.provider_name, provider.model_name).concurrency
+
+    async def run() -> int:
+        stream = provider.stream("hello")
+        await stream.__anext__()
+        await stream.aclose()
+        return concurrency.in_flight
+
+    assert asyncio.run(run()) == 0
+
+
+def test_limit_starts_at_the_maximum_and_ignores_long_streams(monkeypatch):
+    monkeypatch.setattr("src.models.rate_limit.LATENCY_TARGET", 0.01)
+    limiter = ProviderLimiter("test:long-stream")
+    initial = limiter.concurrency.limit
+
+    async def run() -> None:
+        async def open_stream() -> str:
+            return "stream"
+
+        async with limiter.stream(open_stream):
+            await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert initial == limiter.concurrency.maximum
+    assert limiter.concurrency.limit == initial
+
+
+def test_server_errors_halve_the_limit(mock_llm):
+    provider = LocalOpenAIProvider("local/broken")
+    concurrency = get_limiter(provider.provider_name, provider.model_name).concurrency
+    initial = concurrency.limit
+
+    async def run() -> None:
+        with pytest.raises(Exception):
+            await provider.generate("hello")
+
+    asyncio.run(run())
+    assert concurrency.limit == initial / 2
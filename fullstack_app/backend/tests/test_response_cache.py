@@ -0,0 +1,51 @@
+"""
+Response cache keys and coalescing.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Dict, List
+
+from src.models.response_cache import ResponseCache
+
+
+class StructuredModel:
+    sampling_params = {"temperature": 0.6}
+
+    def __init__(self) -> None:
+        self.calls: List[str] = []
+
+    async def generate(self, prompt: str) -> str:
+        self.calls.append("generate")
+        return "plain"
+
+    async def stream_structured(self, prompt: str, schema: Dict[str, Any]) -> AsyncIterator[str]:
+        self.calls.append("structured")
+        await asyncio.sleep(0.01)
+        for part in ('{"rows": ', "[]}"):
+            yield part
+
+
+def test_structured_replies_are_cached_and_coalesced():
+    cache = ResponseCache()
+    model = StructuredModel()
+    schema = {"type": "object"}
+
+    async def run() -> List[str]:
+        first = await asyncio.gather(*(cache.generate(model, "m", "prompt", schema) for _ in range(3)))
+        return first + [await cache.generate(model, "m", "prompt", schema)]
+
+    assert asyncio.run(run()) == ['{"rows": []}'] * 4
+    assert model.calls == ["structured"]
+
+
+def test_schema_is_part_of_the_key():
+    cache = ResponseCache()
+    model = StructuredModel()
+
+    async def run() -> List[str]:
+        return [
+            await cache.generate(model, "m", "prompt"),
+            await cache.generate(model, "m", "prompt", {"type": "object"}),
+        ]
+
+    assert asyncio.run(run()) == ["plain", '{"rows": []}']
+    assert model.calls == ["generate", "structured"]
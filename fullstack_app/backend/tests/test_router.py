@@ -0,0 +1,140 @@
+"""
+Routing across providers, exercised against the mock server of `conftest`.
+"""
+import asyncio
+import time
+from typing import Any, Iterator, List, Tuple
+
+import pytest
+
+from src.models import router
+from src.models.providers import AnthropicProvider, LocalOpenAIProvider
+from src.models.router import RoutedProvider, target_stats
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    monkeypatch.setattr(router, "_stats", {})
+    monkeypatch.setattr(router, "HEDGE_DEFAULT_DELAY", 0.2)
+    yield
+
+
+def local_targets(*models: str) -> List[Tuple[str, Any]]:
+    return [(f"local/{model}", LocalOpenAIProvider(f"local/{model}")) for model in models]
+
+
+async def collect(stream: Any) -> str:
+    return "".join([delta async for delta in stream])
+
+
+async def wait_for(condition: Any, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+def test_routes_to_the_fastest_target(mock_llm):
+    routed = RoutedProvider("chat", local_targets("slow", "fast"))
+
+    async def run() -> List[str]:
+        # Unmeasured targets go first, so both get a latency sample
+        return [await routed.generate("hello") for _ in range(4)]
+
+    answers = asyncio.run(run())
+    assert answers[:2] == ["slow says hi", "fast says hi"]
+    assert answers[2:] == ["fast says hi", "fast says hi"]
+    assert [target for target, _ in routed.ranked()] == ["local/fast", "local/slow"]
+
+
+def test_fails_over_to_the_next_target(mock_llm):
+    routed = RoutedProvider("chat", local_targets("broken", "fast"))
+
+    assert asyncio.run(routed.generate("hello")) == "fast says hi"
+    assert mock_llm.requests == ["broken", "fast"]
+    assert target_stats("local/broken").error_rate == 1.0
+
+
+def test_stream_fails_over_to_the_next_target(mock_llm):
+    routed = RoutedProvider("chat", local_targets("broken", "fast"))
+
+    assert asyncio.run(collect(routed.stream("hello"))) == "fast says hi"
+    assert mock_llm.requests == ["broken", "fast"]
+
+
+def test_unhealthy_target_is_skipped_until_its_cooldown_ends(mock_llm, monkeypatch):
+    monkeypatch.setattr(router, "COOLDOWN", 0.3)
+    routed = RoutedProvider("chat", local_targets("broken", "fast"))
+
+    asyncio.run(routed.generate("hello"))
+    assert not target_stats("local/broken").healthy
+    assert [target for target, _ in routed.ranked()] == ["local/fast", "local/broken"]
+
+    mock_llm.requests.clear()
+    asyncio.run(routed.generate("hello"))
+    assert mock_llm.requests == ["fast"]
+
+    time.sleep(0.35)
+    assert target_stats("local/broken").healthy
+    assert routed.ranked()[0][0] == "local/broken"
+
+
+def test_hedged_generate_cancels_the_slower_request(mock_llm):
+    routed = RoutedProvider("chat", local_targets("slow", "fast"), hedge=True)
+
+    async def run() -> Tuple[str, float, bool]:
+        started = time.monotonic()
+        answer = await routed.generate("hello")
+        elapsed = time.monotonic() - started
+        return answer, elapsed, await wait_for(lambda: "slow" in mock_llm.disconnected)
+
+    answer, elapsed, cancelled = asyncio.run(run())
+    assert answer == "fast says hi"
+    assert elapsed < 0.8
+    assert mock_llm.requests == ["slow", "fast"]
+    assert cancelled
+
+
+def test_hedged_stream_cancels_the_slower_request(mock_llm):
+    routed = RoutedProvider("chat", local_targets("slow", "fast"), hedge=True)
+
+    async def run() -> Tuple[str, float, bool]:
+        started = time.monotonic()
+        text = await collect(routed.stream("hello"))
+        elapsed = time.monotonic() - started
+        return text, elapsed, await wait_for(lambda: "slow" in mock_llm.disconnected)
+
+    text, elapsed, cancelled = asyncio.run(run())
+    assert text == "fast says hi"
+    assert elapsed < 0.8
+    assert cancelled
+
+
+def test_no_hedge_while_the_first_target_is_fast_enough(mock_llm):
+    routed = RoutedProvider("chat", local_targets("fast", "slow"), hedge=True)
+
+    assert asyncio.run(routed.generate("hello")) == "fast says hi"
+    assert mock_llm.requests == ["fast"]
+
+
+def test_anthropic_generate(mock_llm):
+    provider = AnthropicProvider("fast")
+
+    assert asyncio.run(provider.generate("hello")) == "fast says hi"
+
+
+def test_anthropic_stream_parses_sse_events(mock_llm):
+    provider = AnthropicProvider("fast")
+
+    async def run() -> List[str]:
+        return [delta async for delta in provider.stream("hello")]
+
+    assert asyncio.run(run()) == ["fast", " says hi"]
+
+
+def test_anthropic_errors_fail_over(mock_llm):
+    routed = RoutedProvider("chat", [("claude-broken", AnthropicProvider("broken")), *local_targets("fast")])
+
+    assert asyncio.run(routed.generate("hello")) == "fast says hi"
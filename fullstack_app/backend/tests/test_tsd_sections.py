@@ -0,0 +1,43 @@
+"""
+TSD section retries.
+"""
+import asyncio
+from typing import List
+
+import httpx
+
+from src.agents.tsd_agent import agent as tsd
+
+
+def _run_section(monkeypatch, errors: List[Exception], style: str = "paragraph"):
+    monkeypatch.setattr(tsd, "SECTION_RETRIES", 2)
+    monkeypatch.setattr(tsd, "SECTION_RETRY_DELAY", 0)
+    calls = []
+
+    async def fail_then_answer(*args, **kwargs):
+        calls.append(args)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "text" if style == "paragraph" else [{"a": "b"}]
+
+    agent = tsd.Agent()
+    monkeypatch.setattr(agent, "call_llm" if style == "paragraph" else "_generate_table", fail_then_answer)
+    output, ok = asyncio.run(agent._generate_section("job", {"style": style}, "Title", "prompt"))
+    return output, ok, len(calls)
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    error = httpx.ConnectError("reset")
+    output, ok, calls = _run_section(monkeypatch, [error])
+    assert ok and output["content"] == "text" and calls == 2
+
+
+def test_tables_without_valid_rows_are_reprompted(monkeypatch):
+    output, ok, calls = _run_section(monkeypatch, [tsd.NoValidRowsError("no rows")], style="table")
+    assert ok and calls == 2
+
+
+def test_deterministic_errors_fail_fast(monkeypatch):
+    output, ok, calls = _run_section(monkeypatch, [ValueError("Prompt exceeds the context window of 'x'")])
+    assert not ok and calls == 1
+    assert "context window" in output["content"]